@@ -1,13 +1,57 @@
+import time
+from dataclasses import dataclass
+
+import jwt
+from fastapi import HTTPException, Request
+from fastapi_users import FastAPIUsers
 from fastapi_users.authentication import CookieTransport, AuthenticationBackend, JWTStrategy
+from fastapi_users.jwt import generate_jwt, decode_jwt
+from sqlalchemy import select, delete
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from backend.auth.manager import get_user_manager
+from backend.database import async_session_maker
+from backend.models.user import User, TokenRevocation
+from backend.services.cache import TTLCache
+from backend.services.notification import Broker
 
+"""
+Аутентификация по JWT в cookie.
+Токен содержит id, роль и имя пользователя, поэтому текущий пользователь определяется без запроса к бд.
+Токены пользователя, которого изменили, отключили или удалили, отзываются: время отзыва хранится в таблице
+token_revocations и в памяти каждого воркера (рассылается через шину уведомлений), токены, выданные
+не позже этого времени, отклоняются.
+"""
 
 cookie_transport = CookieTransport(cookie_name="Seneka", cookie_max_age=3600)
 
 SECRET = "SECRET"
 
+TOKEN_LIFETIME = 3600
+
+# Канал сообщений об отзыве токенов
+REVOCATIONS_CHANNEL = "token_revocations"
+
+
+class ClaimsJWTStrategy(JWTStrategy):
+    """
+    JWT с ролью, именем и временем выдачи токена
+    """
+
+    async def write_token(self, user: User) -> str:
+        data = {
+            "sub": str(user.id),
+            "aud": self.token_audience,
+            "role": user.role,
+            "name": user.name,
+            # Дробные секунды, чтобы токен, выданный сразу после отзыва, не считался отозванным
+            "iat": time.time(),
+        }
+        return generate_jwt(data, self.encode_key, self.lifetime_seconds, algorithm=self.algorithm)
+
 
 def get_jwt_strategy() -> JWTStrategy:
-    return JWTStrategy(secret=SECRET, lifetime_seconds=3600)
+    return ClaimsJWTStrategy(secret=SECRET, lifetime_seconds=TOKEN_LIFETIME)
 
 
 auth_backend = AuthenticationBackend(
@@ -15,3 +59,114 @@ auth_backend = AuthenticationBackend(
     transport=cookie_transport,
     get_strategy=get_jwt_strategy,
 )
+
+# Единственный экземпляр FastAPIUsers: маршруты входа и регистрации
+fastapi_users = FastAPIUsers[User, int](
+    get_user_manager,
+    [auth_backend],
+)
+
+
+@dataclass(frozen=True)
+class CurrentUser:
+    """
+    Текущий пользователь по данным токена
+    """
+    id: int
+    role: str
+    name: str
+    issued_at: float
+    expires_at: float
+
+
+# Разобранные токены: токен -> CurrentUser
+token_cache = TTLCache("auth_tokens", maxsize=10000, ttl=30.0)
+
+# Отозванные токены: id пользователя -> время отзыва
+revocations: dict[int, float] = {}
+
+_broker: Broker | None = None
+
+
+def _read_token(token: str) -> CurrentUser | None:
+    user = token_cache.get(token)
+    if user is None:
+        strategy = get_jwt_strategy()
+        try:
+            data = decode_jwt(token, strategy.decode_key, strategy.token_audience, algorithms=[strategy.algorithm])
+            user = CurrentUser(int(data["sub"]), data["role"], data["name"], float(data["iat"]), float(data["exp"]))
+        except (jwt.PyJWTError, KeyError, TypeError, ValueError):
+            # Токен без нужных полей (выданный до их появления) требует повторного входа
+            return None
+
+        # Токен, истекающий раньше записи кэша, не кэшируется
+        if user.expires_at - time.time() > token_cache.ttl:
+            token_cache.set(token, user)
+
+    if revocations.get(user.id, 0.0) >= user.issued_at:
+        return None
+    return user
+
+
+async def current_user(request: Request) -> CurrentUser:
+    """
+    Зависимость: текущий активный пользователь из токена в cookie, без запроса к бд
+    :param request: запрос
+    :return: пользователь
+    """
+    token = request.cookies.get(cookie_transport.cookie_name)
+    user = _read_token(token) if token else None
+    if user is None:
+        raise HTTPException(status_code=401, detail="Unauthorized")
+    return user
+
+
+def _on_revocation(message: str) -> None:
+    user_id, _, revoked_at = message.partition(":")
+    revocations[int(user_id)] = max(revocations.get(int(user_id), 0.0), float(revoked_at))
+
+
+async def start(broker: Broker, db: AsyncSession) -> None:
+    """
+    Загрузка действующих отзывов токенов и подписка на новые
+    :param broker: брокер шины уведомлений
+    :param db: бд, сессия
+    """
+    global _broker
+    # Отзывы старше времени жизни токена уже не нужны
+    expired = time.time() - TOKEN_LIFETIME
+    await db.execute(delete(TokenRevocation).where(TokenRevocation.revoked_at < expired))
+    await db.commit()
+    await _load_revocations(db)
+
+    _broker = broker
+    await broker.subscribe(REVOCATIONS_CHANNEL, _on_revocation)
+    broker.on_reconnect(_reload_revocations)
+
+
+async def _load_revocations(db: AsyncSession) -> None:
+    loaded = {revocation.user_id: revocation.revoked_at for revocation in await db.scalars(select(TokenRevocation))}
+    revocations.clear()
+    revocations.update(loaded)
+
+
+async def _reload_revocations() -> None:
+    # Отзывы, разосланные за время обрыва шины, воркер не получил: без перезагрузки токены остались бы действующими
+    async with async_session_maker() as db:
+        await _load_revocations(db)
+
+
+async def revoke(user_id: int, db: AsyncSession) -> None:
+    """
+    Отзыв всех выданных пользователю токенов
+    :param user_id: id пользователя
+    :param db: бд, сессия
+    """
+    revoked_at = time.time()
+    await db.merge(TokenRevocation(user_id=user_id, revoked_at=revoked_at))
+    await db.commit()
+
+    message = f"{user_id}:{revoked_at}"
+    _on_revocation(message)
+    if _broker is not None:
+        await _broker.publish(REVOCATIONS_CHANNEL, message)
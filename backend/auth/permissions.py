@@ -0,0 +1,71 @@
+from fastapi import Depends, HTTPException
+
+from backend.auth.auth import current_user, CurrentUser
+from backend.models.user import UserRole
+
+"""
+Права ролей на действия с ресурсами.
+Таблица разворачивается при импорте в множество разрешенных (роль, ресурс, действие), поэтому проверка
+в запросе - одна операция над множеством. Зависимости проверки прав указываются в dependencies маршрута:
+FastAPI выполняет их раньше зависимостей параметров, и запрос без прав отклоняется до открытия сессии бд.
+"""
+
+# Ресурс -> действие -> роли, которым оно разрешено (администратору разрешено все)
+PERMISSIONS: dict[str, dict[str, set[UserRole]]] = {
+    "product": {
+        "create": {UserRole.manager},
+        "update": {UserRole.manager},
+        "delete": set(),
+        "import": {UserRole.manager},
+        "export": {UserRole.manager},
+        "buy": {UserRole.user},
+    },
+    "image": {
+        "create": {UserRole.manager},
+        "update": {UserRole.manager},
+        "delete": set(),
+        "upload": {UserRole.manager},
+    },
+    "brand": {
+        "create": {UserRole.manager},
+        "update": {UserRole.manager},
+        "delete": set(),
+    },
+    "category": {
+        "create": {UserRole.manager},
+        "update": set(),
+        "delete": set(),
+    },
+    "user": {
+        "read": set(),
+        "update": set(),
+        "delete": set(),
+    },
+}
+
+_allowed: frozenset[tuple[str, str, str]] = frozenset(
+    (role.value, resource, action)
+    for resource, actions in PERMISSIONS.items()
+    for action, roles in actions.items()
+    for role in roles | {UserRole.admin}
+)
+
+
+def require_permission(resource: str, action: str):
+    """
+    Зависимость: текущему пользователю разрешено действие action с ресурсом resource
+    :param resource: ресурс
+    :param action: действие
+    :return: зависимость, возвращающая текущего пользователя
+    """
+    # Опечатка в имени ресурса или действия обнаруживается при запуске, а не отказом в доступе
+    if action not in PERMISSIONS[resource]:
+        raise KeyError(f"Unknown action {resource}.{action}")
+
+    async def dependency(user: CurrentUser = Depends(current_user)) -> CurrentUser:
+        if (user.role, resource, action) not in _allowed:
+            raise HTTPException(status_code=403, detail="You do not have permission to access this resource")
+        return user
+
+    return dependency
+
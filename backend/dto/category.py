@@ -1,5 +1,18 @@
-from pydantic import BaseModel
+from datetime import datetime
+
+from pydantic import BaseModel, ConfigDict
 
 
 class Category(BaseModel):
     name: str
+
+
+class CategoryRead(BaseModel):
+    """
+    Ответ API с данными категории
+    """
+    model_config = ConfigDict(from_attributes=True)
+
+    id: int
+    name: str
+    updated_at: datetime
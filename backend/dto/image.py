@@ -1,6 +1,20 @@
-from pydantic import BaseModel
+from datetime import datetime
+
+from pydantic import BaseModel, ConfigDict
 
 
 class Image(BaseModel):
     name: str
     product_id: int
+
+
+class ImageRead(BaseModel):
+    """
+    Ответ API с данными изображения
+    """
+    model_config = ConfigDict(from_attributes=True)
+
+    id: int
+    name: str
+    product_id: int
+    updated_at: datetime
@@ -1,6 +1,11 @@
-from typing import List
+from datetime import datetime
+from typing import List, Optional
 
-from pydantic import BaseModel
+from pydantic import BaseModel, ConfigDict
+
+from backend.dto.brand import BrandRead
+from backend.dto.category import CategoryRead
+from backend.dto.image import ImageRead
 
 
 class Product(BaseModel):
@@ -15,16 +20,104 @@ class Product(BaseModel):
     price: float
 
 
-class ProductRead(BaseModel):
+class ProductRecord(BaseModel):
     """
-    Передача данных между слоями приложения (database-services/product, database-routers/product)
+    Ответ API с полями товара без связанных данных (создание, изменение, удаление)
     """
+    model_config = ConfigDict(from_attributes=True)
+
+    id: int
     title: str
     description: str
     count: int
+    price: float
     category_id: int
     brand_id: int
-    images: List[int] = []
+    updated_at: datetime
+
+
+class ProductRead(ProductRecord):
+    """
+    Ответ API с товаром и его изображениями (database-services/product, database-routers/product)
+    """
+    images: List[ImageRead] = []
+
+
+class ProductView(BaseModel):
+    """
+    Товар в ответе чтения каталога: только запрошенные поля (?fields=) и связи (?include=).
+    Незапрошенные поля не выводятся (response_model_exclude_unset)
+    """
+    id: Optional[int] = None
+    title: Optional[str] = None
+    description: Optional[str] = None
+    count: Optional[int] = None
+    price: Optional[float] = None
+    category_id: Optional[int] = None
+    brand_id: Optional[int] = None
+    updated_at: Optional[datetime] = None
+    images: Optional[List[ImageRead]] = None
+    category: Optional[CategoryRead] = None
+    brand: Optional[BrandRead] = None
+
+
+class ProductFieldset(BaseModel):
+    """
+    Запрошенные поля и связи товаров (database-services/product, database-routers/product)
+    """
+    # None - все поля ProductRecord
+    fields: Optional[List[str]] = None
+    include: List[str] = ["images"]
+
+
+class ProductPage(BaseModel):
+    """
+    Страница товаров при курсорной пагинации
+    """
+    items: List[ProductView]
+    next_cursor: Optional[str] = None
+    total: Optional[int] = None
+
+
+class FacetCount(BaseModel):
+    """
+    Количество товаров для одного значения фасета (категории или бренда)
+    """
+    id: int
+    count: int
+
+
+class ProductFacets(BaseModel):
+    """
+    Фасеты каталога: общее количество и количества по категориям и брендам
+    """
+    total: int
+    categories: List[FacetCount]
+    brands: List[FacetCount]
+
+
+class ProductImportError(BaseModel):
+    """
+    Строка массовой загрузки, не прошедшая проверку
+    """
+    line: int
+    detail: str
+
+
+class ProductImportResult(BaseModel):
+    """
+    Результат массовой загрузки товаров
+    """
+    inserted: int
+    failed: int
+    errors: List[ProductImportError]
+
+
+class ProductsDeleted(BaseModel):
+    """
+    id удаленных товаров
+    """
+    deleted: List[int]
 
 
 class ProductBuy(BaseModel):
@@ -32,3 +125,22 @@ class ProductBuy(BaseModel):
     Передача данных между слоями приложения (database-services/product, database-routers/product)
     """
     count: int
+
+
+class ProductBuyItem(BaseModel):
+    """
+    Строка корзины при покупке нескольких товаров (database-services/product, database-routers/product)
+    """
+    id: int
+    count: int
+
+
+class ProductFilter(BaseModel):
+    """
+    Фильтры списка товаров и фасетов (database-services/product, database-routers/product)
+    """
+    category_id: List[int] = []
+    brand_id: List[int] = []
+    price_min: Optional[float] = None
+    price_max: Optional[float] = None
+    in_stock: Optional[bool] = None
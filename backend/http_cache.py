@@ -0,0 +1,77 @@
+import hashlib
+from datetime import timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from typing import Any, Iterable, Optional
+
+from fastapi import Request, Response
+
+"""
+Условные GET запросы (ETag / Last-Modified / 304) для чтения каталога.
+ETag строится по версиям строк (id + updated_at), поэтому совпадающий If-None-Match позволяет
+ответить 304 без сериализации ответа.
+"""
+
+# Браузер каждый раз переспрашивает сервер (дешевый 304), CDN может несколько секунд отдавать
+# ответ сам и еще некоторое время отдавать устаревший, пока обновляет его в фоне
+CATALOG_CACHE_CONTROL = "public, max-age=0, s-maxage=5, stale-while-revalidate=30"
+
+
+def make_etag(rows: Iterable[Any], *extra: Any) -> str:
+    """
+    Сильный ETag по набору строк моделей
+    :param rows: строки моделей или DTO ответа с полями id и updated_at
+    :param extra: дополнительные значения, влияющие на ответ (например, общее количество)
+    :return: ETag в кавычках
+    """
+    parts = [(getattr(row, "__tablename__", type(row).__name__), row.id,
+              row.updated_at.isoformat() if row.updated_at else None) for row in rows]
+    digest = hashlib.sha1(repr((parts, extra)).encode()).hexdigest()
+    return f'"{digest}"'
+
+
+def not_modified(request: Request, response: Response, rows: Iterable[Any], *extra: Any,
+                 last_modified: bool = False) -> Optional[Response]:
+    """
+    Выставление заголовков кэширования и проверка условного запроса
+    :param request: запрос
+    :param response: ответ, в который записываются заголовки
+    :param rows: строки моделей, из которых состоит ответ
+    :param extra: дополнительные значения, влияющие на ответ
+    :param last_modified: выставлять Last-Modified (только для одной сущности: при удалении строк
+        из списка максимальное updated_at может не измениться)
+    :return: ответ 304, если у клиента актуальная версия, иначе None
+    """
+    rows = list(rows)
+    headers = {"ETag": make_etag(rows, *extra), "Cache-Control": CATALOG_CACHE_CONTROL}
+
+    modified_at = None
+    if last_modified:
+        modified_at = max((row.updated_at for row in rows if row.updated_at), default=None)
+        if modified_at:
+            # Время без часового пояса (SQLite) считается UTC
+            if modified_at.tzinfo is None:
+                modified_at = modified_at.replace(tzinfo=timezone.utc)
+            headers["Last-Modified"] = format_datetime(modified_at.astimezone(timezone.utc), usegmt=True)
+
+    response.headers.update(headers)
+
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        tags = [tag.strip() for tag in if_none_match.split(",")]
+        if headers["ETag"] in tags or f'W/{headers["ETag"]}' in tags or "*" in tags:
+            return Response(status_code=304, headers=headers)
+        return None
+
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since and modified_at:
+        try:
+            since = parsedate_to_datetime(if_modified_since)
+        except (TypeError, ValueError):
+            return None
+        if since.tzinfo is None:
+            since = since.replace(tzinfo=timezone.utc)
+        # Last-Modified передается с точностью до секунды
+        if modified_at.replace(microsecond=0) <= since:
+            return Response(status_code=304, headers=headers)
+
+    return None
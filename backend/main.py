@@ -2,31 +2,27 @@ from typing import List
 
 import uvicorn
 from fastapi import FastAPI, Depends, HTTPException
-from fastapi_users import FastAPIUsers
 from backend.database import get_db
 
 from fastapi.middleware.cors import CORSMiddleware
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from starlette.websockets import WebSocket, WebSocketDisconnect
 
-from backend.auth.auth import auth_backend
-from backend.auth.database import engine as UserEngine
-from backend.auth.manager import get_user_manager
+from backend.auth import auth as Auth
+from backend.auth.auth import auth_backend, fastapi_users, current_user, CurrentUser
+from backend.auth.permissions import require_permission
 from backend.dto.user import UserRead, UserCreate
 
-from backend.models.user import Base as UserBase
-from backend.database import Base as Base
-from backend.models.user import User
-from backend.database import engine as Engine
+from backend.database import engine as Engine, async_session_maker, pool_status
 
 from backend.routers import brand as BrandRouter, image as ImageRouter, user as UserRouter, product as ProductRouter, \
     category as CategoryRouter
 
-from backend.services import product as ProductService
+from backend.services import product as ProductService, search as SearchService, \
+    notification as NotificationService, cache as CacheService, thumbnail as ThumbnailService, \
+    storage as StorageService
 from backend.dto import product as ProductDTO
-
-Base.metadata.create_all(bind=Engine)
-
+from backend import config, metrics as Metrics, profiling as Profiling
 
 app = FastAPI()
 
@@ -43,20 +39,49 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Профилирование запросов к бд (отладка)
+if config.QUERY_PROFILING:
+    app.add_middleware(Profiling.ProfilingMiddleware)
+
+# Метрики добавляются последними (внешний слой), чтобы время ответа включало остальные middleware
+app.add_middleware(Metrics.MetricsMiddleware)
+
 
 @app.on_event("startup")
 async def startup():
-    # Создание таблицы при запуске приложения
-    async with UserEngine.begin() as conn:
-        await conn.run_sync(UserBase.metadata.create_all)
+    # Учет запросов к бд в метриках и профилировании
+    Metrics.instrument_engine(Engine)
+    Profiling.instrument_engine(Engine)
 
+    # Таблицы и индексы создаются миграциями (alembic upgrade head) до запуска приложения
+
+    # Построение поискового индекса товаров (для PostgreSQL индекс ведет сама СУБД)
+    async with async_session_maker() as db:
+        await SearchService.get_search_index(db).build(db)
+
+    # Подписка воркера на шину уведомлений о покупках и сбросе кэшей
+    await NotificationService.start(Engine)
+    await CacheService.start(NotificationService.broker)
+
+    # Отозванные токены пользователей
+    async with async_session_maker() as db:
+        await Auth.start(NotificationService.broker, db)
+
+    # Индекс папки изображений
+    await StorageService.start(NotificationService.broker)
+
+    # Пул процессов и кэш копий изображений
+    await ThumbnailService.start()
+
+
+@app.on_event("shutdown")
+async def shutdown():
+    await NotificationService.stop()
+    await ThumbnailService.stop()
+    Metrics.stop()
 
 
 
-fastapi_users = FastAPIUsers[User, int](
-    get_user_manager,
-    [auth_backend],
-)
 
 app.include_router(
     fastapi_users.get_auth_router(auth_backend),
@@ -71,14 +96,22 @@ app.include_router(
 )
 
 
-current_user = fastapi_users.current_user()
-
-
 @app.get("/me", tags=["auth"])
-def protected_route(user: User = Depends(current_user)):
+def protected_route(user: CurrentUser = Depends(current_user)):
     return {user}
 
 
+@app.get("/metrics", tags=["health"], include_in_schema=False)
+async def metrics():
+    return Metrics.metrics_response()
+
+
+@app.get("/health/db", tags=["health"])
+async def db_health():
+    # Состояние пула соединений воркера, для подбора DB_POOL_SIZE/DB_MAX_OVERFLOW под max_connections
+    return pool_status()
+
+
 app.include_router(UserRouter.router, prefix='/user')
 app.include_router(ProductRouter.router, prefix='/product')
 app.include_router(CategoryRouter.router, prefix='/category')
@@ -86,10 +119,6 @@ app.include_router(BrandRouter.router, prefix='/brand')
 app.include_router(ImageRouter.router, prefix='/image')
 
 
-# Список подключенных клиентов WebSocket
-manager_websockets: List[WebSocket] = []
-
-
 # Роутер для подключения к WebSocket
 @app.websocket("/ws")
 async def websocket_endpoint(websocket: WebSocket, role: str):
@@ -99,7 +128,7 @@ async def websocket_endpoint(websocket: WebSocket, role: str):
         return
 
     await websocket.accept()
-    manager_websockets.append(websocket)
+    NotificationService.manager_connections.connect(websocket)
 
     try:
         while True:
@@ -110,21 +139,30 @@ async def websocket_endpoint(websocket: WebSocket, role: str):
             # Например, отправить сообщение обратно клиенту или выполнить какие-то действия на сервере
 
     except WebSocketDisconnect:
-        manager_websockets.remove(websocket)
+        NotificationService.manager_connections.disconnect(websocket)
 
 
 # Ваш роутер для покупки товара
-@app.put('/product/buy/{id}', tags=["product"])
-async def buy_product(id: int = None, data: ProductDTO.ProductBuy = None, db: Session = Depends(get_db),
-                      cur_user: User = Depends(fastapi_users.current_user())):
-    if cur_user.role != "admin" and cur_user.role != "user":
-        raise HTTPException(status_code=403, detail="You do not have permission to access this resource")
-
-    # Отправляем сообщение о покупке товара всем подключенным менеджерам
-    for manager_websocket in manager_websockets:
-        await manager_websocket.send_text(f"Пользователь {cur_user.name} купил товар с {id}")
-
-    return ProductService.buy_product(id, data, db)
+@app.put('/product/buy/{id}', tags=["product"], response_model=ProductDTO.ProductRead,
+         dependencies=[Depends(require_permission("product", "buy"))])
+async def buy_product(id: int = None, data: ProductDTO.ProductBuy = None, db: AsyncSession = Depends(get_db),
+                      cur_user: CurrentUser = Depends(current_user)):
+    # Сообщение о покупке товара подключенным менеджерам всех воркеров уходит вместе с фиксацией покупки
+    product = await ProductService.buy_product(id, data, db, f"Пользователь {cur_user.name} купил товар с {id}")
+    if not product:
+        raise HTTPException(status_code=400, detail=f"Product with id {id} not exists")
+
+    return product
+
+
+# Роутер для покупки нескольких товаров одной транзакцией
+@app.post('/product/buy', tags=["product"], response_model=List[ProductDTO.ProductRead],
+          dependencies=[Depends(require_permission("product", "buy"))])
+async def buy_products(data: List[ProductDTO.ProductBuyItem], db: AsyncSession = Depends(get_db),
+                       cur_user: CurrentUser = Depends(current_user)):
+    # Одно сообщение на всю корзину
+    bought = ", ".join(f"{item.id} x{item.count}" for item in data)
+    return await ProductService.buy_products(data, db, f"Пользователь {cur_user.name} купил товары: {bought}")
 
 
 
@@ -0,0 +1,166 @@
+import os
+import time
+from contextvars import ContextVar
+from dataclasses import dataclass
+
+from fastapi import Response
+from prometheus_client import Counter, Gauge, Histogram, CollectorRegistry, REGISTRY, CONTENT_TYPE_LATEST, \
+    generate_latest, multiprocess
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncEngine
+from starlette.types import ASGIApp, Receive, Scope, Send, Message
+
+"""
+Метрики Prometheus: время ответа по роутерам, запросы к бд в каждом HTTP запросе, ожидание соединения из пула,
+WebSocket соединения менеджеров и покупки.
+При запуске нескольких воркеров uvicorn нужно задать PROMETHEUS_MULTIPROC_DIR (пустая папка, общая для воркеров):
+каждый воркер пишет метрики в свои файлы, а /metrics любого воркера собирает их вместе.
+"""
+
+# Роутеры приложения (первый сегмент пути), остальные маршруты попадают в "other"
+ROUTERS = {"product", "category", "brand", "image", "user", "auth", "health"}
+
+# Маршруты вне роутеров, относящиеся к ним по смыслу
+ROUTE_ROUTERS = {"/me": "auth"}
+
+REQUEST_LATENCY = Histogram(
+    "http_request_duration_seconds", "Время обработки HTTP запроса",
+    ["router", "method", "route", "status"],
+)
+REQUEST_STATEMENTS = Histogram(
+    "http_request_db_statements", "Количество запросов к бд за один HTTP запрос",
+    ["router"], buckets=(0, 1, 2, 3, 5, 8, 13, 21, 50, 100),
+)
+REQUEST_DB_TIME = Histogram(
+    "http_request_db_duration_seconds", "Суммарное время запросов к бд за один HTTP запрос",
+    ["router"],
+)
+STATEMENT_LATENCY = Histogram(
+    "db_statement_duration_seconds", "Время выполнения запроса к бд",
+    ["operation"], buckets=(.0005, .001, .0025, .005, .01, .025, .05, .1, .25, .5, 1, 2.5),
+)
+POOL_WAIT = Histogram(
+    "db_pool_checkout_wait_seconds", "Ожидание соединения из пула",
+    buckets=(.0001, .0005, .001, .005, .01, .05, .1, .5, 1, 5, 30),
+)
+WEBSOCKET_CONNECTIONS = Gauge(
+    "websocket_manager_connections", "Подключенные WebSocket менеджеров", multiprocess_mode="livesum",
+)
+PURCHASES = Counter("purchases_total", "Успешные покупки", ["kind"])
+PURCHASED_ITEMS = Counter("purchased_items_total", "Купленные единицы товаров")
+
+
+@dataclass
+class QueryStats:
+    """
+    Запросы к бд, выполненные в рамках одного HTTP запроса
+    """
+    count: int = 0
+    duration: float = 0.0
+
+
+# Статистика текущего HTTP запроса (None вне запроса, например при запуске)
+current_queries: ContextVar[QueryStats | None] = ContextVar("current_queries", default=None)
+
+
+def router_label(path: str) -> str:
+    """
+    Роутер, которому принадлежит запрос
+    :param path: путь запроса
+    :return: имя роутера
+    """
+    if path in ROUTE_ROUTERS:
+        return ROUTE_ROUTERS[path]
+    segment = path.strip("/").split("/", 1)[0]
+    return segment if segment in ROUTERS else "other"
+
+
+class MetricsMiddleware:
+    """
+    ASGI middleware: время ответа и запросы к бд каждого HTTP запроса
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        stats = QueryStats()
+        token = current_queries.set(stats)
+        status = 500
+        start = time.perf_counter()
+
+        async def send_with_status(message: Message) -> None:
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            current_queries.reset(token)
+            # Шаблон пути, а не сам путь, чтобы число рядов метрики не зависело от id в запросах
+            route = scope.get("route")
+            template = route.path if route else "unmatched"
+            router = router_label(scope["path"])
+
+            REQUEST_LATENCY.labels(router, scope["method"], template, str(status)).observe(time.perf_counter() - start)
+            REQUEST_STATEMENTS.labels(router).observe(stats.count)
+            REQUEST_DB_TIME.labels(router).observe(stats.duration)
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany) -> None:
+    context._metrics_start = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany) -> None:
+    elapsed = time.perf_counter() - context._metrics_start
+    STATEMENT_LATENCY.labels(statement.lstrip().split(None, 1)[0].upper()).observe(elapsed)
+
+    stats = current_queries.get()
+    if stats is not None:
+        stats.count += 1
+        stats.duration += elapsed
+
+
+def instrument_engine(engine: AsyncEngine) -> None:
+    """
+    Подписка на события движка для учета запросов к бд
+    :param engine: движок бд
+    """
+    if not event.contains(engine.sync_engine, "before_cursor_execute", _before_cursor_execute):
+        event.listen(engine.sync_engine, "before_cursor_execute", _before_cursor_execute)
+        event.listen(engine.sync_engine, "after_cursor_execute", _after_cursor_execute)
+
+
+def observe_pool_wait(seconds: float) -> None:
+    """
+    Учет ожидания соединения из пула
+    :param seconds: время ожидания
+    """
+    POOL_WAIT.observe(seconds)
+
+
+def metrics_response() -> Response:
+    """
+    Ответ /metrics; при нескольких воркерах - сумма метрик всех воркеров
+    :return: метрики в текстовом формате Prometheus
+    """
+    if "PROMETHEUS_MULTIPROC_DIR" in os.environ:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return Response(generate_latest(registry), media_type=CONTENT_TYPE_LATEST)
+
+
+def stop() -> None:
+    """
+    Удаление живых показателей (gauge) завершающегося воркера из общей папки метрик
+    """
+    if "PROMETHEUS_MULTIPROC_DIR" in os.environ:
+        multiprocess.mark_process_dead(os.getpid())
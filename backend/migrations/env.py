@@ -0,0 +1,59 @@
+import asyncio
+from logging.config import fileConfig
+
+from alembic import context
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlalchemy.pool import NullPool
+
+from backend import config as app_config
+from backend.database import Base
+from backend.models import blob, brand, catalog_counter, category, image, product  # noqa: F401 - регистрация таблиц в Base.metadata
+from backend.models.user import Base as UserBase
+
+"""
+Окружение Alembic: миграции выполняются асинхронным движком без пула и без statement_timeout приложения,
+каждая миграция - в своей транзакции (создание индексов CONCURRENTLY выполняется вне транзакции)
+"""
+
+config = context.config
+if config.config_file_name is not None:
+    fileConfig(config.config_file_name)
+
+target_metadata = [Base.metadata, UserBase.metadata]
+
+url = config.get_main_option("sqlalchemy.url") or app_config.DATABASE_URL
+
+# Индексы по выражениям: PostgreSQL хранит выражение с приведениями типов, и autogenerate всегда видит различие
+EXPRESSION_INDEXES = {"ix_products_search"}
+
+
+def include_object(obj, name, type_, reflected, compare_to) -> bool:
+    return not (type_ == "index" and name in EXPRESSION_INDEXES)
+
+
+def run_migrations_offline() -> None:
+    context.configure(url=url, target_metadata=target_metadata, include_object=include_object, literal_binds=True,
+                      dialect_opts={"paramstyle": "named"}, transaction_per_migration=True)
+    with context.begin_transaction():
+        context.run_migrations()
+
+
+def do_run_migrations(connection) -> None:
+    # SQLite изменяет ограничения только пересозданием таблицы, autogenerate пишет для нее batch_alter_table
+    context.configure(connection=connection, target_metadata=target_metadata, include_object=include_object,
+                      transaction_per_migration=True, render_as_batch=connection.dialect.name == "sqlite")
+    with context.begin_transaction():
+        context.run_migrations()
+
+
+async def run_migrations_online() -> None:
+    engine = create_async_engine(url, poolclass=NullPool)
+    async with engine.connect() as connection:
+        await connection.run_sync(do_run_migrations)
+    await engine.dispose()
+
+
+if context.is_offline_mode():
+    run_migrations_offline()
+else:
+    asyncio.run(run_migrations_online())
@@ -0,0 +1,78 @@
+"""Схема, которую создавал Base.metadata.create_all до появления миграций
+
+Revision ID: 0001
+Revises:
+Create Date: 2026-10-18
+
+Бд, созданные раньше через create_all, переводятся на миграции командой alembic stamp 0001
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "0001"
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "users",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("name", sa.String(), nullable=False),
+        sa.Column("role", sa.String(), nullable=False),
+        sa.Column("email", sa.String(length=320), nullable=False),
+        sa.Column("hashed_password", sa.String(length=1024), nullable=False),
+        sa.Column("is_active", sa.Boolean(), nullable=False),
+        sa.Column("is_superuser", sa.Boolean(), nullable=False),
+        sa.Column("is_verified", sa.Boolean(), nullable=False),
+    )
+    op.create_index("ix_users_id", "users", ["id"])
+    op.create_index("ix_users_name", "users", ["name"], unique=True)
+    op.create_index("ix_users_email", "users", ["email"], unique=True)
+
+    op.create_table(
+        "categories",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("name", sa.String(), nullable=False),
+    )
+    op.create_index("ix_categories_id", "categories", ["id"])
+
+    op.create_table(
+        "brands",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("name", sa.String(), nullable=False),
+    )
+    op.create_index("ix_brands_id", "brands", ["id"])
+
+    op.create_table(
+        "products",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("title", sa.String(), nullable=False),
+        sa.Column("description", sa.String(), nullable=False),
+        sa.Column("count", sa.Integer(), nullable=False),
+        sa.Column("price", sa.Float(), nullable=False),
+        sa.Column("category_id", sa.Integer(), sa.ForeignKey("categories.id", name="products_category_id_fkey"),
+                  nullable=False),
+        sa.Column("brand_id", sa.Integer(), sa.ForeignKey("brands.id", name="products_brand_id_fkey"), nullable=False),
+    )
+    op.create_index("ix_products_id", "products", ["id"])
+
+    op.create_table(
+        "images",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("name", sa.String(), nullable=False),
+        sa.Column("product_id", sa.Integer(), sa.ForeignKey("products.id", name="images_product_id_fkey"),
+                  nullable=False),
+        sa.UniqueConstraint("name", name="images_name_key"),
+    )
+    op.create_index("ix_images_id", "images", ["id"])
+
+
+def downgrade() -> None:
+    op.drop_table("images")
+    op.drop_table("products")
+    op.drop_table("brands")
+    op.drop_table("categories")
+    op.drop_table("users")
@@ -0,0 +1,32 @@
+"""Версии строк каталога
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-18
+
+Колонка updated_at, из которой строятся ETag/Last-Modified. Отдельная ревизия: схема с updated_at, но без
+таблицы blobs, соответствует коду до хранения изображений по содержимому
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "0002"
+down_revision = "0001"
+branch_labels = None
+depends_on = None
+
+CATALOG_TABLES = ("products", "categories", "brands", "images")
+
+
+def upgrade() -> None:
+    # Существующие строки получают время миграции
+    for table in CATALOG_TABLES:
+        op.add_column(table, sa.Column("updated_at", sa.DateTime(timezone=True), server_default=sa.func.now(),
+                                       nullable=False))
+
+
+def downgrade() -> None:
+    for table in CATALOG_TABLES:
+        with op.batch_alter_table(table) as batch:
+            batch.drop_column("updated_at")
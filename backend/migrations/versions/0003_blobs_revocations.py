@@ -0,0 +1,48 @@
+"""Хранение изображений по содержимому, каскадное удаление изображений, отзыв токенов
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-18
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "0003"
+down_revision = "0002"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "blobs",
+        sa.Column("hash", sa.String(length=64), primary_key=True),
+        sa.Column("size", sa.BigInteger(), nullable=False),
+        sa.Column("ref_count", sa.Integer(), nullable=False),
+    )
+    # SQLite не изменяет ограничения ALTER TABLE: в пакетном режиме таблица пересоздается (в PostgreSQL - обычный ALTER)
+    with op.batch_alter_table("images") as batch:
+        batch.add_column(sa.Column("blob_hash", sa.String(length=64), nullable=True))
+        batch.create_foreign_key("images_blob_hash_fkey", "blobs", ["blob_hash"], ["hash"])
+
+        batch.drop_constraint("images_product_id_fkey", type_="foreignkey")
+        batch.create_foreign_key("images_product_id_fkey", "products", ["product_id"], ["id"], ondelete="CASCADE")
+
+    op.create_table(
+        "token_revocations",
+        sa.Column("user_id", sa.Integer(), primary_key=True, autoincrement=False),
+        sa.Column("revoked_at", sa.Float(), nullable=False),
+    )
+
+
+def downgrade() -> None:
+    op.drop_table("token_revocations")
+
+    with op.batch_alter_table("images") as batch:
+        batch.drop_constraint("images_product_id_fkey", type_="foreignkey")
+        batch.create_foreign_key("images_product_id_fkey", "products", ["product_id"], ["id"])
+
+        batch.drop_constraint("images_blob_hash_fkey", type_="foreignkey")
+        batch.drop_column("blob_hash")
+    op.drop_table("blobs")
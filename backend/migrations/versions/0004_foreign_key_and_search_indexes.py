@@ -0,0 +1,47 @@
+"""Индексы внешних ключей и полнотекстового поиска
+
+Revision ID: 0004
+Revises: 0003
+Create Date: 2026-10-18
+
+Индексы строятся CONCURRENTLY, без блокировки записи в таблицы, поэтому миграция выполняется вне транзакции.
+Если построение прервалось, PostgreSQL оставляет недействительный индекс: его нужно удалить и повторить миграцию
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "0004"
+down_revision = "0003"
+branch_labels = None
+depends_on = None
+
+# Имя индекса, таблица, колонки
+FOREIGN_KEY_INDEXES = [
+    ("ix_products_category_id", "products", ["category_id"]),
+    ("ix_products_brand_id", "products", ["brand_id"]),
+    ("ix_images_product_id", "images", ["product_id"]),
+    ("ix_images_blob_hash", "images", ["blob_hash"]),
+]
+
+# Должно совпадать с backend.models.product.search_document, иначе планировщик не использует индекс
+SEARCH_DOCUMENT = "to_tsvector('simple'::regconfig, title || ' ' || description)"
+
+
+def upgrade() -> None:
+    with op.get_context().autocommit_block():
+        for name, table, columns in FOREIGN_KEY_INDEXES:
+            op.create_index(name, table, columns, postgresql_concurrently=True, if_not_exists=True)
+
+        # Полнотекстовый индекс есть только в PostgreSQL, в остальных бд поиск идет по индексу в памяти
+        if op.get_bind().dialect.name == "postgresql":
+            op.create_index("ix_products_search", "products", [sa.text(SEARCH_DOCUMENT)], postgresql_using="gin",
+                            postgresql_concurrently=True, if_not_exists=True)
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        if op.get_bind().dialect.name == "postgresql":
+            op.drop_index("ix_products_search", "products", postgresql_concurrently=True, if_exists=True)
+        for name, table, _ in reversed(FOREIGN_KEY_INDEXES):
+            op.drop_index(name, table, postgresql_concurrently=True, if_exists=True)
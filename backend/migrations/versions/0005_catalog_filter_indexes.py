@@ -0,0 +1,44 @@
+"""Составные индексы фильтров и сортировок каталога
+
+Revision ID: 0005
+Revises: 0004
+Create Date: 2026-10-18
+
+Индексы (category_id, price, id) и (brand_id, price, id) заменяют индексы внешних ключей category_id и brand_id
+"""
+from alembic import op
+
+
+revision = "0005"
+down_revision = "0004"
+branch_labels = None
+depends_on = None
+
+# Имя индекса, колонки таблицы products
+CATALOG_INDEXES = [
+    ("ix_products_category_id_price", ["category_id", "price", "id"]),
+    ("ix_products_brand_id_price", ["brand_id", "price", "id"]),
+    ("ix_products_price", ["price", "id"]),
+    ("ix_products_title", ["title", "id"]),
+]
+
+REPLACED_INDEXES = [
+    ("ix_products_category_id", ["category_id"]),
+    ("ix_products_brand_id", ["brand_id"]),
+]
+
+
+def upgrade() -> None:
+    with op.get_context().autocommit_block():
+        for name, columns in CATALOG_INDEXES:
+            op.create_index(name, "products", columns, postgresql_concurrently=True, if_not_exists=True)
+        for name, _ in REPLACED_INDEXES:
+            op.drop_index(name, "products", postgresql_concurrently=True, if_exists=True)
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        for name, columns in REPLACED_INDEXES:
+            op.create_index(name, "products", columns, postgresql_concurrently=True, if_not_exists=True)
+        for name, _ in reversed(CATALOG_INDEXES):
+            op.drop_index(name, "products", postgresql_concurrently=True, if_exists=True)
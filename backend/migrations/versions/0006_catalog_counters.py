@@ -0,0 +1,40 @@
+"""Счетчики товаров каталога
+
+Revision ID: 0006
+Revises: 0005
+Create Date: 2026-10-18
+
+Счетчики заполняются по текущему содержимому products; на время заполнения таблица products
+блокируется для записи, чтобы счетчики не разошлись с изменениями, идущими параллельно
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "0006"
+down_revision = "0005"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "catalog_counters",
+        sa.Column("category_id", sa.Integer(), primary_key=True, autoincrement=False),
+        sa.Column("brand_id", sa.Integer(), primary_key=True, autoincrement=False),
+        sa.Column("in_stock", sa.Boolean(), primary_key=True),
+        sa.Column("count", sa.Integer(), nullable=False),
+    )
+
+    if op.get_bind().dialect.name == "postgresql":
+        op.execute("LOCK TABLE products IN SHARE MODE")
+    op.execute("""
+        INSERT INTO catalog_counters (category_id, brand_id, in_stock, count)
+        SELECT category_id, brand_id, count > 0, count(*)
+        FROM products
+        GROUP BY category_id, brand_id, count > 0
+    """)
+
+
+def downgrade() -> None:
+    op.drop_table("catalog_counters")
@@ -0,0 +1,16 @@
+
+from sqlalchemy import Column, Integer, String, BigInteger
+
+from backend.database import Base
+
+
+class Blob(Base):
+    """
+    Таблица blobs: содержимое файлов изображений, хранящееся один раз под своим SHA-256
+    """
+    __tablename__ = "blobs"
+
+    hash: String = Column(String(64), primary_key=True, nullable=False)
+    size: BigInteger = Column(BigInteger, nullable=False)
+    # Количество имен файлов в public/img, ссылающихся на это содержимое
+    ref_count: Integer = Column(Integer, nullable=False, default=0)
@@ -0,0 +1,16 @@
+from sqlalchemy import Column, Integer, Boolean
+
+from backend.database import Base
+
+
+class CatalogCounter(Base):
+    """
+    Таблица catalog_counters: количество товаров для каждой пары (категория, бренд) отдельно в наличии и нет.
+    Поддерживается сервисами товаров в тех же транзакциях, что и изменения products
+    """
+    __tablename__ = "catalog_counters"
+
+    category_id: Integer = Column(Integer, primary_key=True, autoincrement=False, nullable=False)
+    brand_id: Integer = Column(Integer, primary_key=True, autoincrement=False, nullable=False)
+    in_stock: Boolean = Column(Boolean, primary_key=True, nullable=False)
+    count: Integer = Column(Integer, nullable=False, default=0)
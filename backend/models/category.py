@@ -1,7 +1,7 @@
 
-from sqlalchemy import Column, Integer, String
+from sqlalchemy import Column, Integer, String, DateTime, func
 
-from backend.database import Base
+from backend.database import Base, utcnow
 
 
 class Category(Base):
@@ -12,3 +12,6 @@ class Category(Base):
 
     id = Column(Integer, primary_key=True, index=True, nullable=False)
     name: String = Column(String, nullable=False)
+    # Время последнего изменения строки, из него строятся ETag/Last-Modified для HTTP кэширования
+    updated_at = Column(DateTime(timezone=True), default=utcnow, onupdate=utcnow, server_default=func.now(),
+                        nullable=False)
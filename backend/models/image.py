@@ -1,8 +1,8 @@
 
-from sqlalchemy import Column, Integer, String, ForeignKey
+from sqlalchemy import Column, Integer, String, ForeignKey, DateTime, func
 from sqlalchemy.orm import relationship
 
-from backend.database import Base
+from backend.database import Base, utcnow
 
 
 class Image(Base):
@@ -13,6 +13,12 @@ class Image(Base):
 
     id = Column(Integer, primary_key=True, index=True, nullable=False)
     name: String = Column(String, unique=True, nullable=False)
+    # Время последнего изменения строки, из него строятся ETag/Last-Modified для HTTP кэширования
+    updated_at = Column(DateTime(timezone=True), default=utcnow, onupdate=utcnow, server_default=func.now(),
+                        nullable=False)
 
-    product_id = Column(Integer, ForeignKey('products.id'), nullable=False)
+    # Содержимое файла (None для файлов, положенных в папку вручную, а не загруженных через API)
+    blob_hash = Column(String(64), ForeignKey('blobs.hash'), index=True, nullable=True)
+
+    product_id = Column(Integer, ForeignKey('products.id', ondelete='CASCADE'), index=True, nullable=False)
     product = relationship("Product", back_populates="images")
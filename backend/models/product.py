@@ -1,7 +1,18 @@
-from sqlalchemy import Column, Integer, String, ForeignKey, Float
+from sqlalchemy import Column, Integer, String, ForeignKey, Float, Index, func, literal_column, DateTime
 from sqlalchemy.orm import relationship
 
-from backend.database import Base
+from backend.database import Base, utcnow
+
+
+def search_document(title, description):
+    """
+    Поисковый документ товара (название + описание) для полнотекстового поиска PostgreSQL.
+    Константы заданы литералами, а не параметрами, чтобы выражение в запросе совпадало с выражением индекса
+    :param title: колонка названия
+    :param description: колонка описания
+    :return: выражение to_tsvector
+    """
+    return func.to_tsvector(literal_column("'simple'::regconfig"), title + literal_column("' '") + description)
 
 
 class Product(Base):
@@ -15,6 +26,9 @@ class Product(Base):
     description: String = Column(String, nullable=False)
     count: Integer = Column(Integer, nullable=False)
     price: Float = Column(Float, nullable=False)
+    # Время последнего изменения строки, из него строятся ETag/Last-Modified для HTTP кэширования
+    updated_at = Column(DateTime(timezone=True), default=utcnow, onupdate=utcnow, server_default=func.now(),
+                        nullable=False)
 
     category_id = Column(Integer, ForeignKey('categories.id'), nullable=False)
     category = relationship("Category", backref="products")
@@ -22,4 +36,16 @@ class Product(Base):
     brand_id = Column(Integer, ForeignKey('brands.id'), nullable=False)
     brand = relationship("Brand", backref="products")
 
-    images = relationship("Image", back_populates="product")
+    # Изображения удаляет бд (ON DELETE CASCADE), ORM не загружает их при удалении товара
+    images = relationship("Image", back_populates="product", passive_deletes=True)
+
+    __table_args__ = (
+        # Фильтр по категории или бренду с сортировкой по цене (и индексы внешних ключей)
+        Index("ix_products_category_id_price", category_id, price, id),
+        Index("ix_products_brand_id_price", brand_id, price, id),
+        # Сортировки каталога без фильтра по категории и бренду
+        Index("ix_products_price", price, id),
+        Index("ix_products_title", title, id),
+        Index("ix_products_search", search_document(title, description),
+              postgresql_using="gin").ddl_if(dialect="postgresql"),
+    )
@@ -1,5 +1,5 @@
 from fastapi_users_db_sqlalchemy import SQLAlchemyBaseUserTable
-from sqlalchemy import Column, Integer, String, Enum, Boolean
+from sqlalchemy import Column, Integer, String, Enum, Boolean, Float
 from sqlalchemy.orm import DeclarativeBase, relationship
 from enum import Enum as BaseEnum
 
@@ -8,7 +8,7 @@ class Base(DeclarativeBase):
     pass
 
 
-# Перечисление для типа роли
+# Перечисление для типа роли (права ролей - в backend/auth/permissions.py)
 class UserRole(str, BaseEnum):
     admin = "admin"  # Все права
     manager = "manager"  # CRUD для: продукты, категории, изображения, бренды
@@ -26,3 +26,14 @@ class User(SQLAlchemyBaseUserTable[int], Base):
     is_active: bool = Column(Boolean, default=True, nullable=False)
     is_superuser: bool = Column(Boolean, default=False, nullable=False)
     is_verified: bool = Column(Boolean, default=False, nullable=False)
+
+
+class TokenRevocation(Base):
+    """
+    Таблица token_revocations: токены пользователя, выданные не позже revoked_at, недействительны
+    """
+    __tablename__ = "token_revocations"
+
+    user_id = Column(Integer, primary_key=True)
+    # Время отзыва, секунды с начала эпохи
+    revoked_at = Column(Float, nullable=False)
@@ -0,0 +1,184 @@
+import json
+import logging
+import time
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncEngine
+from starlette.types import ASGIApp, Receive, Scope, Send, Message
+
+from backend import config
+
+"""
+Профилирование запросов к бд для отладки (включается QUERY_PROFILING).
+Для каждого HTTP запроса считаются запросы к бд; одинаковый запрос, выполненный с разными параметрами
+N_PLUS_ONE_THRESHOLD раз и больше, записывается в лог как N+1; превышение бюджета запросов (QUERY_BUDGET или
+query_budget маршрута) к началу ответа пишется в лог, а при QUERY_BUDGET_STRICT ответ заменяется ошибкой 500,
+чтобы тесты падали.
+Независимо от профилирования запросы дольше SLOW_QUERY_MS пишутся в лог с планом EXPLAIN.
+"""
+
+logger = logging.getLogger("backend.queries")
+
+# Запросы, план которых можно получить через EXPLAIN
+EXPLAINABLE = {"SELECT", "INSERT", "UPDATE", "DELETE", "WITH"}
+
+
+@dataclass
+class RequestProfile:
+    """
+    Запросы к бд одного HTTP запроса
+    """
+    budget: int
+    count: int = 0
+    # Текст запроса -> параметры (repr) -> количество выполнений
+    statements: dict[str, dict[str, int]] = field(default_factory=dict)
+
+
+current_profile: ContextVar[RequestProfile | None] = ContextVar("current_profile", default=None)
+
+
+def query_budget(limit: int):
+    """
+    Зависимость маршрута: свой бюджет запросов к бд вместо QUERY_BUDGET
+    :param limit: максимум запросов за HTTP запрос
+    :return: зависимость
+    """
+    def dependency() -> None:
+        profile = current_profile.get()
+        if profile is not None:
+            profile.budget = limit
+
+    return dependency
+
+
+class ProfilingMiddleware:
+    """
+    ASGI middleware: профиль запросов к бд каждого HTTP запроса, заголовок X-Query-Count
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        request = f"{scope['method']} {scope['path']}"
+        profile = RequestProfile(budget=config.QUERY_BUDGET)
+        token = current_profile.set(profile)
+        # Ответ заменен ошибкой превышения бюджета, сообщения исходного ответа не отправляются
+        replaced = False
+
+        async def send_with_count(message: Message) -> None:
+            nonlocal replaced
+            if message["type"] == "http.response.start":
+                # Бюджет проверяется до отправки ответа, чтобы в строгом режиме клиент получил ошибку
+                exceeded = check_budget(profile, request)
+                if exceeded and config.QUERY_BUDGET_STRICT:
+                    replaced = True
+                    await _send_error(send, exceeded, profile.count)
+                    return
+                message["headers"] = [*message.get("headers", []), (b"x-query-count", str(profile.count).encode())]
+            elif replaced:
+                return
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_count)
+        finally:
+            current_profile.reset(token)
+        report(profile, request)
+
+
+async def _send_error(send: Send, detail: str, count: int) -> None:
+    body = json.dumps({"detail": detail}).encode()
+    await send({"type": "http.response.start", "status": 500, "headers": [
+        (b"content-type", b"application/json"),
+        (b"content-length", str(len(body)).encode()),
+        (b"x-query-count", str(count).encode()),
+    ]})
+    await send({"type": "http.response.body", "body": body})
+
+
+def check_budget(profile: RequestProfile, request: str) -> str | None:
+    """
+    Проверка бюджета запросов к бд, превышение пишется в лог
+    :param profile: профиль HTTP запроса
+    :param request: метод и путь запроса (для лога)
+    :return: сообщение о превышении или None
+    """
+    if profile.budget and profile.count > profile.budget:
+        message = f"{request} executed {profile.count} queries, budget is {profile.budget}"
+        logger.error(message)
+        return message
+    return None
+
+
+def report(profile: RequestProfile, request: str) -> None:
+    """
+    Запись в лог найденных N+1 после завершения HTTP запроса
+    :param profile: профиль HTTP запроса
+    :param request: метод и путь запроса (для лога)
+    """
+    for statement, parameters in profile.statements.items():
+        if len(parameters) >= config.N_PLUS_ONE_THRESHOLD:
+            logger.warning("N+1 in %s: %d executions with %d different parameter sets of\n%s",
+                           request, sum(parameters.values()), len(parameters), statement)
+
+
+def _explain(conn, statement: str, parameters) -> str:
+    prefix = "EXPLAIN QUERY PLAN " if conn.dialect.name == "sqlite" else "EXPLAIN "
+    # Отдельный курсор того же соединения: план строится в той же транзакции, события движка не вызываются
+    cursor = conn.connection.cursor()
+    savepoint = conn.dialect.name == "postgresql"
+    try:
+        # Ошибка EXPLAIN в PostgreSQL прервала бы транзакцию запроса, поэтому он выполняется в точке сохранения
+        if savepoint:
+            cursor.execute("SAVEPOINT profiling_explain")
+        try:
+            cursor.execute(prefix + statement, parameters)
+            plan = "\n".join(" | ".join(str(value) for value in row) for row in cursor.fetchall())
+        except Exception as e:
+            if savepoint:
+                cursor.execute("ROLLBACK TO SAVEPOINT profiling_explain")
+            plan = f"EXPLAIN failed: {e}"
+        if savepoint:
+            cursor.execute("RELEASE SAVEPOINT profiling_explain")
+        return plan
+    finally:
+        cursor.close()
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany) -> None:
+    context._profiling_start = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany) -> None:
+    elapsed = time.perf_counter() - context._profiling_start
+
+    profile = current_profile.get()
+    if profile is not None:
+        profile.count += 1
+        parameters_count = profile.statements.setdefault(statement, {})
+        key = repr(parameters)
+        parameters_count[key] = parameters_count.get(key, 0) + 1
+
+    if config.SLOW_QUERY_MS and elapsed * 1000 >= config.SLOW_QUERY_MS and not executemany:
+        operation = statement.lstrip().split(None, 1)[0].upper()
+        plan = _explain(conn, statement, parameters) if operation in EXPLAINABLE else ""
+        logger.warning("Slow query %.1f ms:\n%s\nparameters: %r\n%s", elapsed * 1000, statement, parameters, plan)
+
+
+def instrument_engine(engine: AsyncEngine) -> None:
+    """
+    Подписка на события движка, если включено профилирование или лог медленных запросов
+    :param engine: движок бд
+    """
+    if not (config.QUERY_PROFILING or config.SLOW_QUERY_MS):
+        return
+    if not event.contains(engine.sync_engine, "before_cursor_execute", _before_cursor_execute):
+        event.listen(engine.sync_engine, "before_cursor_execute", _before_cursor_execute)
+        event.listen(engine.sync_engine, "after_cursor_execute", _after_cursor_execute)
@@ -1,11 +1,12 @@
-from fastapi import APIRouter, Depends, HTTPException
-from fastapi_users import FastAPIUsers
-from sqlalchemy.orm import Session
+from typing import Optional, List
 
-from backend.auth.auth import auth_backend
-from backend.auth.manager import get_user_manager
+from fastapi import APIRouter, Depends, HTTPException, Request, Response
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from backend.auth.permissions import require_permission
 from backend.database import get_db
-from backend.models.user import User
+from backend.profiling import query_budget
+from backend import http_cache as HttpCache
 
 from backend.services import brand as BrandService
 from backend.dto import brand as BrandDTO
@@ -16,44 +17,40 @@ router = APIRouter()
 router - контроллер, обработчик маршрутов, который выполняет машинную логику, в нашем случае ассинхронно
 """
 
-fastapi_users = FastAPIUsers[User, int](
-    get_user_manager,
-    [auth_backend],
-)
-
 
-@router.post('/', tags=["brand"])
-async def create(data: BrandDTO.Brand = None, db: Session = Depends(get_db),
-                 cur_user: User = Depends(fastapi_users.current_user())):
-    if cur_user.role != "admin" and cur_user.role != "manager":
-        raise HTTPException(status_code=403, detail="You do not have permission to access this resource")
-    return BrandService.create_brand(data, db)
+@router.post('/', tags=["brand"], response_model=BrandDTO.BrandRead,
+             dependencies=[Depends(require_permission("brand", "create"))])
+async def create(data: BrandDTO.Brand = None, db: AsyncSession = Depends(get_db)):
+    return await BrandService.create_brand(data, db)
 
 
-@router.get('/{id}', tags=["brand"])
-async def get_brand_by_id(id: int = None, db: Session = Depends(get_db)):
-    brand = BrandService.get_brand_by_id(id, db)
+@router.get('/{id}', tags=["brand"], response_model=BrandDTO.BrandRead,
+            dependencies=[Depends(query_budget(1))])
+async def get_brand_by_id(id: int = None, db: AsyncSession = Depends(get_db)):
+    brand = await BrandService.get_brand_by_id(id, db)
     if not brand:
         raise HTTPException(status_code=400, detail=f"Brand with id {id} not exists")
     return brand
 
 
-@router.get('/', tags=["brand"])
-async def get_brands(db: Session = Depends(get_db)):
-    return BrandService.get_brands(db)
+@router.get('/', tags=["brand"], response_model=List[BrandDTO.BrandRead],
+            dependencies=[Depends(query_budget(1))])
+async def get_brands(request: Request, response: Response, db: AsyncSession = Depends(get_db)):
+    brands = await BrandService.get_brands(db)
+
+    not_modified = HttpCache.not_modified(request, response, brands)
+    if not_modified:
+        return not_modified
+    return brands
 
 
-@router.put('/{id}', tags=["brand"])
-async def update(id: int = None, data: BrandDTO.Brand = None, db: Session = Depends(get_db),
-                 cur_user: User = Depends(fastapi_users.current_user())):
-    if cur_user.role != "admin" and cur_user.role != "manager":
-        raise HTTPException(status_code=403, detail="You do not have permission to access this resource")
-    return BrandService.update(id, data, db)
+@router.put('/{id}', tags=["brand"], response_model=Optional[BrandDTO.BrandRead],
+            dependencies=[Depends(require_permission("brand", "update"))])
+async def update(id: int = None, data: BrandDTO.Brand = None, db: AsyncSession = Depends(get_db)):
+    return await BrandService.update(id, data, db)
 
 
-@router.delete('/{id}', tags=["brand"])
-async def delete(id: int = None, db: Session = Depends(get_db),
-                 cur_user: User = Depends(fastapi_users.current_user())):
-    if cur_user.role != "admin":
-        raise HTTPException(status_code=403, detail="You do not have permission to access this resource")
-    return BrandService.remove(id, db)
+@router.delete('/{id}', tags=["brand"], response_model=Optional[BrandDTO.BrandRead],
+                dependencies=[Depends(require_permission("brand", "delete"))])
+async def delete(id: int = None, db: AsyncSession = Depends(get_db)):
+    return await BrandService.remove(id, db)
@@ -1,13 +1,12 @@
-from typing import Optional
+from typing import Optional, List
 
-from fastapi import APIRouter, Depends, HTTPException, Query
-from fastapi_users import FastAPIUsers
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Depends, HTTPException, Request, Response
+from sqlalchemy.ext.asyncio import AsyncSession
 
-from backend.auth.auth import auth_backend
-from backend.auth.manager import get_user_manager
+from backend.auth.permissions import require_permission
 from backend.database import get_db
-from backend.models.user import User
+from backend.profiling import query_budget
+from backend import http_cache as HttpCache
 
 from backend.services import category as CategoryService
 from backend.dto import category as CategoryDTO
@@ -18,44 +17,40 @@ router = APIRouter()
 router - контроллер, обработчик маршрутов, который выполняет машинную логику, в нашем случае ассинхронно
 """
 
-fastapi_users = FastAPIUsers[User, int](
-    get_user_manager,
-    [auth_backend],
-)
 
+@router.post('/', tags=["category"], response_model=CategoryDTO.CategoryRead,
+             dependencies=[Depends(require_permission("category", "create"))])
+async def create(data: CategoryDTO.Category = None, db: AsyncSession = Depends(get_db)):
+    return await CategoryService.create_category(data, db)
 
-@router.post('/', tags=["category"])
-async def create(data: CategoryDTO.Category = None, db: Session = Depends(get_db),
-                 cur_user: User = Depends(fastapi_users.current_user())):
-    if cur_user.role != "admin" and cur_user.role != "manager":
-        raise HTTPException(status_code=403, detail="You do not have permission to access this resource")
-    return CategoryService.create_category(data, db)
 
-
-@router.get('/{id}', tags=["category"])
-async def get_category_by_id(id: int = None, db: Session = Depends(get_db)):
-    category = CategoryService.get_category(id, db)
+@router.get('/{id}', tags=["category"], response_model=CategoryDTO.CategoryRead,
+            dependencies=[Depends(query_budget(1))])
+async def get_category_by_id(id: int = None, db: AsyncSession = Depends(get_db)):
+    category = await CategoryService.get_category(id, db)
     if not category:
         raise HTTPException(status_code=400, detail=f"Category with id {id} not exists")
     return category
 
 
-@router.get('/', tags=["category"])
-async def get_categories(db: Session = Depends(get_db)):
-    return CategoryService.get_categories(db)
+@router.get('/', tags=["category"], response_model=List[CategoryDTO.CategoryRead],
+            dependencies=[Depends(query_budget(1))])
+async def get_categories(request: Request, response: Response, db: AsyncSession = Depends(get_db)):
+    categories = await CategoryService.get_categories(db)
+
+    not_modified = HttpCache.not_modified(request, response, categories)
+    if not_modified:
+        return not_modified
+    return categories
 
 
-@router.put('/{id}', tags=["category"])
-async def update(id: int = None, data: CategoryDTO.Category = None, db: Session = Depends(get_db),
-                 cur_user: User = Depends(fastapi_users.current_user())):
-    if cur_user.role != "admin":
-        raise HTTPException(status_code=403, detail="You do not have permission to access this resource")
-    return CategoryService.update(id, data, db)
+@router.put('/{id}', tags=["category"], response_model=Optional[CategoryDTO.CategoryRead],
+            dependencies=[Depends(require_permission("category", "update"))])
+async def update(id: int = None, data: CategoryDTO.Category = None, db: AsyncSession = Depends(get_db)):
+    return await CategoryService.update(id, data, db)
 
 
-@router.delete('/{id}', tags=["category"])
-async def delete(id: int = None, db: Session = Depends(get_db),
-                 cur_user: User = Depends(fastapi_users.current_user())):
-    if cur_user.role != "admin":
-        raise HTTPException(status_code=403, detail="You do not have permission to access this resource")
-    return CategoryService.remove(id, db)
+@router.delete('/{id}', tags=["category"], response_model=Optional[CategoryDTO.CategoryRead],
+                dependencies=[Depends(require_permission("category", "delete"))])
+async def delete(id: int = None, db: AsyncSession = Depends(get_db)):
+    return await CategoryService.remove(id, db)
@@ -1,13 +1,14 @@
-from fastapi import APIRouter, Depends, HTTPException, UploadFile, File
-from fastapi_users import FastAPIUsers
-from sqlalchemy.orm import Session
+from typing import Optional, List
 
-from backend.auth.auth import auth_backend
-from backend.auth.manager import get_user_manager
+from fastapi import APIRouter, Depends, HTTPException, Request, Response, Query, BackgroundTasks
+from fastapi.responses import FileResponse
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from backend.auth.permissions import require_permission
 from backend.database import get_db
-from backend.models.user import User
+from backend import http_cache as HttpCache
 
-from backend.services import image as ImageService
+from backend.services import image as ImageService, thumbnail as ThumbnailService, storage as StorageService
 from backend.dto import image as ImageDTO
 
 router = APIRouter()
@@ -16,54 +17,75 @@ router = APIRouter()
 router - контроллер, обработчик маршрутов, который выполняет машинную логику, в нашем случае ассинхронно
 """
 
-fastapi_users = FastAPIUsers[User, int](
-    get_user_manager,
-    [auth_backend],
-)
-
 
-@router.post('/', tags=["image"])
-async def create(data: ImageDTO.Image = None, db: Session = Depends(get_db),
-                 cur_user: User = Depends(fastapi_users.current_user())):
-    if cur_user.role != "admin" and cur_user.role != "manager":
-        raise HTTPException(status_code=403, detail="You do not have permission to access this resource")
-    return ImageService.create_image(data, db)
+@router.post('/', tags=["image"], response_model=ImageDTO.ImageRead,
+             dependencies=[Depends(require_permission("image", "create"))])
+async def create(data: ImageDTO.Image = None, db: AsyncSession = Depends(get_db)):
+    return await ImageService.create_image(data, db)
 
 
-@router.get('/{id}', tags=["image"])
-async def get_image_by_id(id: int = None, db: Session = Depends(get_db)):
-    image = ImageService.get_image_by_id(id, db)
+@router.get('/{id}', tags=["image"], response_model=ImageDTO.ImageRead)
+async def get_image_by_id(id: int = None, db: AsyncSession = Depends(get_db)):
+    image = await ImageService.get_image_by_id(id, db)
     if not image:
         raise HTTPException(status_code=400, detail=f"Image with id {id} not exists")
     return image
 
 
-@router.get('/', tags=["image"])
-async def get_images(db: Session = Depends(get_db)):
-    return ImageService.get_images(db)
+@router.get('/{id}/render', tags=["image"])
+async def render_image(id: int, w: int = Query(..., ge=16, le=2048), fmt: str = Query("webp", pattern="^(webp|jpeg|png)$"),
+                       db: AsyncSession = Depends(get_db)):
+    image = await ImageService.get_image_by_id(id, db)
+    if not image:
+        raise HTTPException(status_code=400, detail=f"Image with id {id} not exists")
+
+    source_path, source_key = await ImageService.get_image_source(image)
+    path, stat = await ThumbnailService.render(source_path, source_key, w, fmt)
+    # FileResponse отдает файл с диска без загрузки в память (sendfile, если сервер поддерживает pathsend)
+    return FileResponse(path, stat_result=stat, media_type=f"image/{fmt}",
+                        headers={"Cache-Control": "public, max-age=86400"})
+
+
+@router.get('/', tags=["image"], response_model=List[ImageDTO.ImageRead])
+async def get_images(request: Request, response: Response, db: AsyncSession = Depends(get_db)):
+    images = await ImageService.get_images(db)
+
+    not_modified = HttpCache.not_modified(request, response, images)
+    if not_modified:
+        return not_modified
+    return images
 
 
-@router.put('/{id}', tags=["image"])
-async def update(id: int = None, data: ImageDTO.Image = None, db: Session = Depends(get_db),
-                 cur_user: User = Depends(fastapi_users.current_user())):
-    if cur_user.role != "admin" and cur_user.role != "manager":
-        raise HTTPException(status_code=403, detail="You do not have permission to access this resource")
-    return ImageService.update(id, data, db)
+@router.put('/{id}', tags=["image"], response_model=Optional[ImageDTO.ImageRead],
+            dependencies=[Depends(require_permission("image", "update"))])
+async def update(id: int = None, data: ImageDTO.Image = None, db: AsyncSession = Depends(get_db)):
+    return await ImageService.update(id, data, db)
 
 
-@router.delete('/{id}', tags=["image"])
-async def delete(id: int = None, db: Session = Depends(get_db),
-                 cur_user: User = Depends(fastapi_users.current_user())):
-    if cur_user.role != "admin":
-        raise HTTPException(status_code=403, detail="You do not have permission to access this resource")
-    return ImageService.remove(id, db)
+@router.delete('/{id}', tags=["image"], response_model=Optional[ImageDTO.ImageRead],
+               dependencies=[Depends(require_permission("image", "delete"))])
+async def delete(background_tasks: BackgroundTasks, id: int = None, db: AsyncSession = Depends(get_db)):
+    image = await ImageService.remove(id, db)
+    if image:
+        # Файл изображения освобождается после отправки ответа
+        background_tasks.add_task(StorageService.release_files, [(image.name, image.blob_hash)])
+    return image
+
 
+# Тело читается самим обработчиком потоком, поэтому форма описывается для документации вручную
+UPLOAD_FORM = {
+    "requestBody": {
+        "required": True,
+        "content": {"multipart/form-data": {"schema": {
+            "type": "object",
+            "properties": {"file": {"type": "string", "format": "binary"}},
+            "required": ["file"],
+        }}},
+    },
+}
 
-@router.post('/upload/', tags=["image"])
-async def upload_image(file: UploadFile = File(...),
-                 cur_user: User = Depends(fastapi_users.current_user())):
-    if cur_user.role != "admin" and cur_user.role != "manager":
-        raise HTTPException(status_code=403, detail="You do not have permission to access this resource")
 
-    ImageService.upload_image(file)
-    return file.filename
\ No newline at end of file
+@router.post('/upload/', tags=["image"], response_model=str, openapi_extra=UPLOAD_FORM,
+             dependencies=[Depends(require_permission("image", "upload"))])
+async def upload_image(request: Request, db: AsyncSession = Depends(get_db)):
+    return await ImageService.upload_image(request, db)
\ No newline at end of file
@@ -1,16 +1,17 @@
-from typing import Optional, List
+from typing import Optional, List, Tuple, Union
 
-from fastapi import APIRouter, Depends, HTTPException
-from fastapi_users import FastAPIUsers
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Depends, HTTPException, Request, Response, Query, BackgroundTasks
+from fastapi.responses import StreamingResponse
+from sqlalchemy.ext.asyncio import AsyncSession
 from starlette.websockets import WebSocket, WebSocketDisconnect
 
-from backend.auth.auth import auth_backend
-from backend.auth.manager import get_user_manager
+from backend.auth.permissions import require_permission
 from backend.database import get_db
-from backend.models.user import User
+from backend.profiling import query_budget
+from backend import config, http_cache as HttpCache
 
-from backend.services import product as ProductService
+from backend.services import product as ProductService, product_bulk as ProductBulkService, \
+    storage as StorageService
 from backend.dto import product as ProductDTO
 
 router = APIRouter()
@@ -19,59 +20,139 @@ router = APIRouter()
 router - контроллер, обработчик маршрутов, который выполняет машинную логику, в нашем случае ассинхронно
 """
 
-fastapi_users = FastAPIUsers[User, int](
-    get_user_manager,
-    [auth_backend],
-)
+# Допустимые значения ?sort= (см. ProductService.SORTS)
+SORT_PATTERN = "^(" + "|".join(ProductService.SORTS) + ")$"
 
 
-@router.post('/', tags=["product"])
-async def create(data: ProductDTO.Product = None, db: Session = Depends(get_db),
-                 cur_user: User = Depends(fastapi_users.current_user())):
-    if cur_user.role != "admin" and cur_user.role != "manager":
-        raise HTTPException(status_code=403, detail="You do not have permission to access this resource")
+def product_filter(category_id: List[int] = Query([]), brand_id: List[int] = Query([]),
+                   price_min: Optional[float] = Query(None, ge=0), price_max: Optional[float] = Query(None, ge=0),
+                   in_stock: Optional[bool] = None) -> ProductDTO.ProductFilter:
+    # Несколько категорий или брендов: ?category_id=1&category_id=2
+    return ProductDTO.ProductFilter(category_id=category_id, brand_id=brand_id, price_min=price_min,
+                                    price_max=price_max, in_stock=in_stock)
 
-    return ProductService.create_product(data, db)
 
+def product_fieldset(fields: Optional[str] = Query(None, description="Поля товара через запятую"),
+                     include: Optional[str] = Query(None, description="Связи через запятую: category, brand, images"),
+                     ) -> ProductDTO.ProductFieldset:
+    # По умолчанию - все поля и изображения, ?include= без значения - без связей
+    return ProductService.parse_fieldset(fields, include)
 
-@router.get('/{id}', tags=["product"])
-async def get_product_by_id(id: int = None, db: Session = Depends(get_db)):
-    product = ProductService.get_product(id, db)
-    if not product:
-        raise HTTPException(status_code=400, detail=f"Product with id {id} not exists")
-    return product
 
+@router.post('/', tags=["product"], response_model=ProductDTO.ProductRecord,
+             dependencies=[Depends(require_permission("product", "create"))])
+async def create(data: ProductDTO.Product = None, db: AsyncSession = Depends(get_db)):
+    return await ProductService.create_product(data, db)
 
-@router.get('/', tags=["product"])
-async def get_products(db: Session = Depends(get_db), skip: int = 0, limit: int = 10,
-                       search_query: Optional[str] = None):
-    return ProductService.get_products(db, skip, limit, search_query)
 
+@router.post('/bulk', tags=["product"], response_model=ProductDTO.ProductImportResult,
+             dependencies=[Depends(require_permission("product", "import"))])
+async def bulk_import(request: Request, fmt: Optional[str] = Query(None, pattern="^(ndjson|csv)$"),
+                      db: AsyncSession = Depends(get_db)):
+    # Формат берется из ?fmt=, иначе из Content-Type (text/csv или NDJSON)
+    if fmt is None:
+        fmt = "csv" if "csv" in request.headers.get("content-type", "") else "ndjson"
+    return await ProductBulkService.import_products(request.stream(), fmt, db)
 
-@router.get('/count/1', tags=["product"])
-async def get_count_products( db: Session = Depends(get_db)):
-    return ProductService.get_count_products(db)
 
+@router.get('/export', tags=["product"], dependencies=[Depends(require_permission("product", "export"))])
+async def export(fmt: str = Query("ndjson", pattern="^(ndjson|csv)$")):
+    return StreamingResponse(ProductBulkService.export_products(fmt), media_type=ProductBulkService.FORMATS[fmt],
+                             headers={"Content-Disposition": f"attachment; filename=products.{fmt}"})
 
-@router.put('/{id}', tags=["product"])
-async def update(id: int = None, data: ProductDTO.Product = None, db: Session = Depends(get_db),
-                 cur_user: User = Depends(fastapi_users.current_user())):
-    if cur_user.role != "admin" and cur_user.role != "manager":
-        raise HTTPException(status_code=403, detail="You do not have permission to access this resource")
 
-    return ProductService.update(id, data, db)
+@router.get('/facets', tags=["product"], response_model=ProductDTO.ProductFacets,
+            dependencies=[Depends(query_budget(1))])
+async def get_facets(request: Request, response: Response, search_query: Optional[str] = None,
+                     filters: ProductDTO.ProductFilter = Depends(product_filter), db: AsyncSession = Depends(get_db)):
+    facets = await ProductService.get_facets(db, filters, search_query)
 
+    not_modified = HttpCache.not_modified(request, response, [], facets)
+    if not_modified:
+        return not_modified
+    return facets
 
-@router.delete('/{id}', tags=["product"])
-async def delete(id: int = None, db: Session = Depends(get_db),
-                 cur_user: User = Depends(fastapi_users.current_user())):
-    if cur_user.role != "admin":
-        raise HTTPException(status_code=403, detail="You do not have permission to access this resource")
-    return ProductService.remove(id, db)
+
+@router.get('/{id}', tags=["product"], response_model=ProductDTO.ProductView, response_model_exclude_unset=True,
+            dependencies=[Depends(query_budget(4))])
+async def get_product_by_id(request: Request, response: Response, id: int = None,
+                            fieldset: ProductDTO.ProductFieldset = Depends(product_fieldset),
+                            db: AsyncSession = Depends(get_db)):
+    product = await ProductService.read_product(id, db, fieldset)
+    if not product:
+        raise HTTPException(status_code=400, detail=f"Product with id {id} not exists")
+
+    not_modified = HttpCache.not_modified(request, response, ProductService.product_versions([product]),
+                                          fieldset.model_dump_json(), last_modified=True)
+    if not_modified:
+        return not_modified
+    return product
+
+
+# Без after_id - пара [товары, общее количество], с after_id - страница курсорной пагинации
+@router.get('/', tags=["product"], response_model_exclude_unset=True,
+            response_model=Union[ProductDTO.ProductPage, Tuple[List[ProductDTO.ProductView], int]],
+            dependencies=[Depends(query_budget(5))])
+async def get_products(request: Request, response: Response, db: AsyncSession = Depends(get_db),
+                       skip: int = Query(0, ge=0), limit: int = Query(10, ge=0),
+                       search_query: Optional[str] = None, after_id: Optional[str] = None,
+                       with_count: bool = False, filters: ProductDTO.ProductFilter = Depends(product_filter),
+                       sort: Optional[str] = Query(None, pattern=SORT_PATTERN),
+                       fieldset: ProductDTO.ProductFieldset = Depends(product_fieldset)):
+    # Курсорная пагинация: ?after_id= для первой страницы, далее ?after_id=<next_cursor> с той же сортировкой
+    if after_id is not None:
+        # Размер курсорной страницы ограничивается: продолжение идет по next_cursor, поэтому клиент ничего не пропустит.
+        # В режиме skip/limit ограничения нет - клиенты, сдвигающие skip на limit, пропускали бы товары
+        if limit == 0:
+            raise HTTPException(status_code=400, detail="Limit should be > 0")
+        limit = min(limit, config.PRODUCT_PAGE_MAX_SIZE)
+        page = await ProductService.get_products_page(db, after_id, limit, search_query, with_count, filters,
+                                                      sort or "id", fieldset)
+        products, extra = page["items"], (page["next_cursor"], page["total"])
+    else:
+        page = await ProductService.get_products(db, skip, limit, search_query, filters, sort, fieldset)
+        products, extra = page[0], (page[1],)
+
+    # Набор полей входит в ETag: одни и те же строки с разными ?fields= - разные ответы
+    not_modified = HttpCache.not_modified(request, response, ProductService.product_versions(products),
+                                          fieldset.model_dump_json(), *extra)
+    if not_modified:
+        return not_modified
+    return page
+
+
+@router.get('/count/1', tags=["product"], response_model=int,
+            dependencies=[Depends(query_budget(1))])
+async def get_count_products( db: AsyncSession = Depends(get_db)):
+    return await ProductService.get_count_products(db)
+
+
+@router.put('/{id}', tags=["product"], response_model=Optional[ProductDTO.ProductRecord],
+            dependencies=[Depends(require_permission("product", "update"))])
+async def update(id: int = None, data: ProductDTO.Product = None, db: AsyncSession = Depends(get_db)):
+    return await ProductService.update(id, data, db)
+
+
+@router.delete('/', tags=["product"], response_model=ProductDTO.ProductsDeleted,
+               dependencies=[Depends(require_permission("product", "delete"))])
+async def delete_many(background_tasks: BackgroundTasks, ids: List[int] = Query(..., max_length=1000),
+                      db: AsyncSession = Depends(get_db)):
+    products, files = await ProductService.remove_products(ids, db)
+    # Файлы изображений освобождаются после отправки ответа
+    background_tasks.add_task(StorageService.release_files, files)
+    return {"deleted": [product.id for product in products]}
+
+
+@router.delete('/{id}', tags=["product"], response_model=Optional[ProductDTO.ProductRecord],
+               dependencies=[Depends(require_permission("product", "delete"))])
+async def delete(background_tasks: BackgroundTasks, id: int = None, db: AsyncSession = Depends(get_db)):
+    product, files = await ProductService.remove(id, db)
+    background_tasks.add_task(StorageService.release_files, files)
+    return product
 
 
 # @router.put('/buy/{id}', tags=["product"])
-# async def buy_product(id: int = None, data: ProductDTO.ProductBuy = None, db: Session = Depends(get_db), cur_user: User = Depends(fastapi_users.current_user())):
+# async def buy_product(id: int = None, data: ProductDTO.ProductBuy = None, db: AsyncSession = Depends(get_db), cur_user: User = Depends(fastapi_users.current_user())):
 #     if cur_user.role != "admin" and cur_user.role != "user":
 #         raise HTTPException(status_code=403, detail="You do not have permission to access this resource")
 #     return ProductService.buy_product(id, data, db)
@@ -101,7 +182,7 @@ manager_websockets: List[WebSocket] = []
 #
 # # Ваш роутер для покупки товара
 # @router.put('/buy/{id}', tags=["product"])
-# async def buy_product(id: int = None, data: ProductDTO.ProductBuy = None, db: Session = Depends(get_db),
+# async def buy_product(id: int = None, data: ProductDTO.ProductBuy = None, db: AsyncSession = Depends(get_db),
 #                       cur_user: User = Depends(fastapi_users.current_user())):
 #     if cur_user.role != "admin" and cur_user.role != "user":
 #         raise HTTPException(status_code=403, detail="You do not have permission to access this resource")
@@ -1,11 +1,17 @@
-from typing import Type
+from typing import Sequence
 
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from backend.database import read_all
 from backend.dto import brand as BrandDTO
 from backend.models.brand import Brand
+from backend.services.cache import TTLCache, invalidate
 
+# Кэш брендов: id -> объект, "all" -> список
+brand_cache = TTLCache("brand")
 
-def create_brand(data: Brand, db: Session) -> Brand:
+
+async def create_brand(data: Brand, db: AsyncSession) -> Brand:
     """
     Создание бренда
     :param data: данные о бренде
@@ -17,15 +23,16 @@ def create_brand(data: Brand, db: Session) -> Brand:
 
     try:
         db.add(brand)
-        db.commit()
-        db.refresh(brand)
+        await db.commit()
+        await db.refresh(brand)
+        await invalidate(brand_cache)
     except Exception as e:
         print(e)
 
     return brand
 
 
-def get_brand_by_id(id: int, db: Session) -> Brand | None:
+async def get_brand_by_id(id: int, db: AsyncSession) -> Brand | None:
     """
     Получение 1 бренда по id
     :param id: id бренда
@@ -33,24 +40,35 @@ def get_brand_by_id(id: int, db: Session) -> Brand | None:
     :return: Полученный бренд
     """
 
-    return (
-        db.query(Brand)
-        .filter(Brand.id == id)
-        .first()
-    )
+    brand = brand_cache.get(id)
+    if brand is None:
+        brand = await db.scalar(
+            select(Brand)
+            .where(Brand.id == id)
+        )
+        if brand:
+            db.expunge(brand)
+            brand_cache.set(id, brand)
+
+    return brand
 
 
-def get_brands(db: Session) -> list[Type[Brand]]:
+async def get_brands(db: AsyncSession) -> Sequence[BrandDTO.BrandRead]:
     """
     Получение списка брендов
     :param db: бд, сессия
     :return: список брендов
     """
 
-    return db.query(Brand).all()
+    brands = brand_cache.get("all")
+    if brands is None:
+        brands = await read_all(Brand, BrandDTO.BrandRead, db)
+        brand_cache.set("all", brands)
+
+    return brands
 
 
-def update(id: int, data: BrandDTO.Brand, db: Session) -> Brand | None:
+async def update(id: int, data: BrandDTO.Brand, db: AsyncSession) -> Brand | None:
     """
     Обновление информации о бренде по id
     :param id: id бренде
@@ -59,32 +77,35 @@ def update(id: int, data: BrandDTO.Brand, db: Session) -> Brand | None:
     :return: бренд, если она существует, в ином случае - None
     """
 
-    brand = get_brand_by_id(id, db)
+    # Изменяемый объект берется из бд, а не из кэша
+    brand = await db.get(Brand, id)
     # Проверка соответствия нового статуса
     if brand:
         # Обновляем только те поля, которые присутствуют в data
         for field, value in data.dict(exclude_unset=True).items():
             setattr(brand, field, value)
 
-        db.commit()
-        db.refresh(brand)
+        await db.commit()
+        await db.refresh(brand)
+        await invalidate(brand_cache)
 
         return brand
     return None
 
 
-def remove(id: int, db: Session) -> int | None:
+async def remove(id: int, db: AsyncSession) -> int | None:
     """
     Удаляем бренд по id
     :param id: id бренда
     :param db: сессия/бд
     :return: кол-во удаленных строк, если бренд существует, иначе None
     """
-    brand = db.query(Brand).filter(Brand.id == id).first()
+    brand = await db.scalar(select(Brand).where(Brand.id == id))
 
     if brand:
-        db.delete(brand)
-        db.commit()
+        await db.delete(brand)
+        await db.commit()
+        await invalidate(brand_cache)
 
     return brand
 
@@ -0,0 +1,113 @@
+import time
+from collections import OrderedDict
+from typing import Any, Hashable
+
+from backend.services.notification import Broker
+
+"""
+Кэш редко меняющихся справочников (категории, бренды) в памяти воркера.
+Запись живет не дольше ttl секунд, при переполнении вытесняется давно не использованная (LRU).
+При изменении данных кэш сбрасывается во всех воркерах: через шину уведомлений рассылается
+новая версия (метка времени), и воркер со старой версией очищает свой кэш.
+"""
+
+# Канал сообщений о сбросе кэшей
+CACHE_CHANNEL = "cache_invalidation"
+
+_MISSING = object()
+
+
+class TTLCache:
+    """
+    LRU кэш с временем жизни записей и версией
+    """
+
+    def __init__(self, name: str, maxsize: int = 1024, ttl: float = 60.0):
+        self.name = name
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.version = 0
+        self._data: OrderedDict[Hashable, tuple[float, Any]] = OrderedDict()
+        caches[name] = self
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """
+        Получение значения из кэша
+        :param key: ключ
+        :param default: значение, если ключа нет или запись устарела
+        :return: значение
+        """
+        item = self._data.get(key, _MISSING)
+        if item is _MISSING:
+            return default
+
+        expires, value = item
+        if expires < time.monotonic():
+            del self._data[key]
+            return default
+
+        self._data.move_to_end(key)
+        return value
+
+    def set(self, key: Hashable, value: Any) -> None:
+        """
+        Сохранение значения в кэш
+        :param key: ключ
+        :param value: значение
+        """
+        self._data[key] = (time.monotonic() + self.ttl, value)
+        self._data.move_to_end(key)
+        if len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def clear(self, version: int | None = None) -> None:
+        """
+        Очистка кэша
+        :param version: новая версия кэша; устаревшие сообщения (с версией не новее текущей) игнорируются
+        """
+        if version is not None:
+            if version <= self.version:
+                return
+            self.version = version
+        self._data.clear()
+
+
+# Все кэши воркера по имени
+caches: dict[str, TTLCache] = {}
+
+_broker: Broker | None = None
+
+
+def _on_invalidation(message: str) -> None:
+    name, _, version = message.rpartition(":")
+    cache = caches.get(name)
+    if cache:
+        cache.clear(int(version))
+
+
+async def start(broker: Broker) -> None:
+    """
+    Подписка воркера на сообщения о сбросе кэшей
+    :param broker: брокер шины уведомлений
+    """
+    global _broker
+    _broker = broker
+    await broker.subscribe(CACHE_CHANNEL, _on_invalidation)
+    broker.on_reconnect(_clear_all)
+
+
+async def _clear_all() -> None:
+    # Сообщения о сбросе за время обрыва шины потеряны, поэтому очищаются все кэши
+    for cache in caches.values():
+        cache.clear()
+
+
+async def invalidate(cache: TTLCache) -> None:
+    """
+    Сброс кэша в текущем воркере и рассылка новой версии остальным
+    :param cache: кэш
+    """
+    version = time.time_ns()
+    cache.clear(version)
+    if _broker is not None:
+        await _broker.publish(CACHE_CHANNEL, f"{cache.name}:{version}")
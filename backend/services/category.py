@@ -1,12 +1,17 @@
-from typing import Type
+from typing import Sequence
 
-from sqlalchemy import desc, asc
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from backend.database import read_all
 from backend.dto import category as CategoryDTO
 from backend.models.category import Category
+from backend.services.cache import TTLCache, invalidate
 
+# Кэш категорий: id -> объект, "all" -> список
+category_cache = TTLCache("category")
 
-def create_category(data: Category, db: Session) -> Category:
+
+async def create_category(data: Category, db: AsyncSession) -> Category:
     """
     Создание категории
     :param data: данные об категории
@@ -18,15 +23,16 @@ def create_category(data: Category, db: Session) -> Category:
 
     try:
         db.add(category)
-        db.commit()
-        db.refresh(category)
+        await db.commit()
+        await db.refresh(category)
+        await invalidate(category_cache)
     except Exception as e:
         print(e)
 
     return category
 
 
-def get_category(id: int, db: Session) -> Category | None:
+async def get_category(id: int, db: AsyncSession) -> Category | None:
     """
     Получение 1 категории по id
     :param id: id категории
@@ -34,24 +40,35 @@ def get_category(id: int, db: Session) -> Category | None:
     :return: Полученная категория
     """
 
-    return (
-        db.query(Category)
-        .filter(Category.id == id)
-        .first()
-    )
+    category = category_cache.get(id)
+    if category is None:
+        category = await db.scalar(
+            select(Category)
+            .where(Category.id == id)
+        )
+        if category:
+            db.expunge(category)
+            category_cache.set(id, category)
+
+    return category
 
 
-def get_categories(db: Session) -> list[Type[Category]]:
+async def get_categories(db: AsyncSession) -> Sequence[CategoryDTO.CategoryRead]:
     """
     Получение списка категорий
     :param db: бд, сессия
     :return: список категорий
     """
 
-    return db.query(Category).all()
+    categories = category_cache.get("all")
+    if categories is None:
+        categories = await read_all(Category, CategoryDTO.CategoryRead, db)
+        category_cache.set("all", categories)
+
+    return categories
 
 
-def update(id: int, data: CategoryDTO.Category, db: Session) -> Category | None:
+async def update(id: int, data: CategoryDTO.Category, db: AsyncSession) -> Category | None:
     """
     Обновление информации о категории по id
     :param id: id категории
@@ -60,31 +77,34 @@ def update(id: int, data: CategoryDTO.Category, db: Session) -> Category | None:
     :return: категория, если она существует, в ином случае - None
     """
 
-    category = get_category(id, db)
+    # Изменяемый объект берется из бд, а не из кэша
+    category = await db.get(Category, id)
     # Проверка соответствия нового статуса
     if category:
         # Обновляем только те поля, которые присутствуют в data
         for field, value in data.dict(exclude_unset=True).items():
             setattr(category, field, value)
 
-        db.commit()
-        db.refresh(category)
+        await db.commit()
+        await db.refresh(category)
+        await invalidate(category_cache)
 
         return category
     return None
 
 
-def remove(id: int, db: Session) -> int | None:
+async def remove(id: int, db: AsyncSession) -> int | None:
     """
     Удаляем category по id
     :param id: id category
     :param db: сессия/бд
     :return: кол-во удаленных строк, если продукт существует, иначе None
     """
-    category = db.query(Category).filter(Category.id == id).first()
+    category = await db.scalar(select(Category).where(Category.id == id))
 
     if category:
-        db.delete(category)
-        db.commit()
+        await db.delete(category)
+        await db.commit()
+        await invalidate(category_cache)
 
     return category
\ No newline at end of file
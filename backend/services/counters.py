@@ -0,0 +1,119 @@
+from typing import Iterable, Optional, Sequence
+
+from sqlalchemy import Select, select, func, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from backend.dto import product as ProductDTO
+from backend.models.catalog_counter import CatalogCounter
+
+"""
+Счетчики товаров каталога (catalog_counters) вместо COUNT(*) по products.
+Общее количество, количество по категориям, брендам и наличию читается суммой по строкам счетчиков,
+число которых не зависит от числа товаров. Фильтры по цене и поиск счетчиками не покрываются
+"""
+
+# (категория, бренд, в наличии)
+CounterKey = tuple[int, int, bool]
+
+
+def counter_key(category_id: int, brand_id: int, count: int) -> CounterKey:
+    """
+    Строка счетчиков, к которой относится товар
+    :param category_id: категория товара
+    :param brand_id: бренд товара
+    :param count: остаток товара
+    :return: ключ строки счетчиков
+    """
+    return category_id, brand_id, count > 0
+
+
+def count_changes(removed: Iterable[CounterKey] = (), added: Iterable[CounterKey] = ()) -> dict[CounterKey, int]:
+    """
+    Изменения счетчиков по ключам удаленных и добавленных товаров
+    :param removed: ключи товаров до изменения (удаленных)
+    :param added: ключи товаров после изменения (добавленных)
+    :return: ключ -> изменение количества
+    """
+    changes: dict[CounterKey, int] = {}
+    for key in removed:
+        changes[key] = changes.get(key, 0) - 1
+    for key in added:
+        changes[key] = changes.get(key, 0) + 1
+    return changes
+
+
+def _where(query, key: CounterKey):
+    category_id, brand_id, in_stock = key
+    return query.where(CatalogCounter.category_id == category_id, CatalogCounter.brand_id == brand_id,
+                       CatalogCounter.in_stock == in_stock)
+
+
+async def adjust(changes: dict[CounterKey, int], db: AsyncSession) -> None:
+    """
+    Изменение счетчиков в текущей транзакции (фиксирует вызывающий вместе с изменением товаров).
+    Строки обновляются в порядке ключа, чтобы параллельные транзакции не блокировали друг друга по кругу
+    :param changes: ключ -> изменение количества
+    :param db: бд, сессия
+    """
+    for key, delta in sorted(changes.items()):
+        if not delta:
+            continue
+        increment = _where(update(CatalogCounter), key).values(count=CatalogCounter.count + delta)
+        if (await db.execute(increment)).rowcount:
+            continue
+        try:
+            # Точка сохранения: при вставке той же строки параллельной транзакцией откатывается только вставка
+            async with db.begin_nested():
+                category_id, brand_id, in_stock = key
+                db.add(CatalogCounter(category_id=category_id, brand_id=brand_id, in_stock=in_stock, count=delta))
+        except IntegrityError:
+            await db.execute(increment)
+
+
+def covers(filters: Optional[ProductDTO.ProductFilter], search_query: Optional[str] = None) -> bool:
+    """
+    Можно ли посчитать товары по счетчикам
+    :param filters: фильтры списка товаров
+    :param search_query: поисковая строка
+    :return: True, если нет поиска и фильтров по цене
+    """
+    if search_query:
+        return False
+    return filters is None or (filters.price_min is None and filters.price_max is None)
+
+
+def _filter(query: Select, filters: Optional[ProductDTO.ProductFilter], by_category: bool = True,
+            by_brand: bool = True) -> Select:
+    if filters is None:
+        return query
+    if by_category and filters.category_id:
+        query = query.where(CatalogCounter.category_id.in_(filters.category_id))
+    if by_brand and filters.brand_id:
+        query = query.where(CatalogCounter.brand_id.in_(filters.brand_id))
+    if filters.in_stock is not None:
+        query = query.where(CatalogCounter.in_stock == filters.in_stock)
+    return query
+
+
+async def count(db: AsyncSession, filters: Optional[ProductDTO.ProductFilter] = None) -> int:
+    """
+    Количество товаров по счетчикам
+    :param db: бд, сессия
+    :param filters: фильтры по категории, бренду и наличию (см. covers)
+    :return: количество товаров
+    """
+    return await db.scalar(_filter(select(func.coalesce(func.sum(CatalogCounter.count), 0)), filters))
+
+
+async def pair_counts(db: AsyncSession, filters: Optional[ProductDTO.ProductFilter] = None) -> Sequence:
+    """
+    Количество товаров по парам (категория, бренд) для фасетов, без фильтров по категории и бренду
+    :param db: бд, сессия
+    :param filters: фильтры (применяется только наличие)
+    :return: строки (category_id, brand_id, количество)
+    """
+    query = select(CatalogCounter.category_id, CatalogCounter.brand_id, func.sum(CatalogCounter.count)) \
+        .where(CatalogCounter.count > 0) \
+        .group_by(CatalogCounter.category_id, CatalogCounter.brand_id)
+    return (await db.execute(_filter(query, filters, by_category=False, by_brand=False))).all()
@@ -1,18 +1,37 @@
 import os
-from typing import Type
+from typing import Sequence
 
-from fastapi import HTTPException, UploadFile, File
-from sqlalchemy.orm import Session
+from fastapi import HTTPException, Request
+from sqlalchemy import select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+from starlette.concurrency import run_in_threadpool
+
+from backend import config
+from backend.database import read_all
 from backend.dto import image as ImageDTO
 from backend.models.image import Image
-from backend.services.product import get_product
+from backend.models.product import Product
+from backend.services import storage, upload
+
 
+def _check_name(name: str) -> None:
+    """
+    Проверка, что имя изображения - имя файла в папке изображений, без каталогов
+    :param name: имя изображения
+    """
+    if not name or os.path.basename(name) != name or name in (".", ".."):
+        raise HTTPException(status_code=400, detail=f"Invalid file name")
 
-def validate_image(image: Image, db) -> bool:
-    # Проверяем существование продукта
-    product = get_product(image.product_id, db)
-    if not product:
-        raise HTTPException(status_code=404, detail=f"Product with id {image.product_id} does not exist")
+
+async def validate_image(image: Image) -> str | None:
+    """
+    Проверка изображения перед записью: тип файла и существование файла (по индексу папки изображений).
+    Существование продукта и уникальность имени проверяет сама бд ограничениями при вставке
+    :param image: данные об изображении
+    :return: SHA-256 содержимого файла (None, если файл положен в папку вручную)
+    """
+    _check_name(str(image.name))
 
     # Проверка типа файла
     allowed_extensions = {".jpg", ".jpeg", ".png"}  # Разрешенные расширения файлов
@@ -21,21 +40,23 @@ def validate_image(image: Image, db) -> bool:
     if file_extension.lower() not in allowed_extensions:
         raise HTTPException(status_code=400, detail=f"Not allowed type of file")
 
-    # Проверка уникальности имени файла
-    existing_image = db.query(Image).filter(Image.name == image.name).first()
-    if existing_image:
-        raise HTTPException(status_code=400, detail=f"File already exists")
-
     # Проверка существования файла
-    # Получаем абсолютный путь к файлу относительно текущей директории проекта
-    base_dir = os.path.dirname(os.path.abspath(__file__))  # Путь к текущему файлу
-    file_path = os.path.join(base_dir, "../..", "react", "React-shop", "public", "img", str(image.name))  # Путь к изображению
-    if not os.path.exists(file_path):
+    exists, blob_hash = await storage.find(str(image.name))
+    if not exists:
         raise HTTPException(status_code=400, detail=f"File not exists")
-    return True
+    return blob_hash
+
+
+async def _integrity_error(id: int | None, name: str, product_id: int, db: AsyncSession) -> HTTPException:
+    # Причина нарушения ограничения выясняется только при ошибке, в обычном случае запрос к бд один
+    if await db.scalar(select(Image.id).where(Image.name == name, Image.id != id)):
+        return HTTPException(status_code=400, detail=f"File already exists")
+    if not await db.scalar(select(Product.id).where(Product.id == product_id)):
+        return HTTPException(status_code=404, detail=f"Product with id {product_id} does not exist")
+    return HTTPException(status_code=400, detail=f"Image violates a database constraint")
 
 
-def create_image(data: Image, db: Session) -> Image:
+async def create_image(data: ImageDTO.Image, db: AsyncSession) -> Image:
     """
     Создание изображения
     :param data: данные об изображении
@@ -43,21 +64,20 @@ def create_image(data: Image, db: Session) -> Image:
     :return: Созданное изображение
     """
 
-    validate_image(data, db)
-
     image = Image(**data.dict())
+    image.blob_hash = await validate_image(image)
 
+    db.add(image)
     try:
-        db.add(image)
-        db.commit()
-        db.refresh(image)
-    except Exception as e:
-        print(e)
+        await db.commit()
+    except IntegrityError:
+        await db.rollback()
+        raise await _integrity_error(None, data.name, data.product_id, db)
 
     return image
 
 
-def get_image_by_id(id: int, db: Session) -> Image | None:
+async def get_image_by_id(id: int, db: AsyncSession) -> Image | None:
     """
     Получение 1 изображения по id
     :param id: id изображения
@@ -65,24 +85,22 @@ def get_image_by_id(id: int, db: Session) -> Image | None:
     :return: Полученное изображение
     """
 
-    return (
-        db.query(Image)
-        .filter(Image.id == id)
-        .first()
+    return await db.scalar(
+        select(Image)
+        .where(Image.id == id)
     )
 
 
-def get_images(db: Session) -> list[Type[Image]]:
+async def get_images(db: AsyncSession) -> Sequence[ImageDTO.ImageRead]:
     """
     Получение списка изображений
     :param db: бд, сессия
     :return: список изображений
     """
-
-    return db.query(Image).all()
+    return await read_all(Image, ImageDTO.ImageRead, db)
 
 
-def update(id: int, data: ImageDTO.Image, db: Session) -> Image | None:
+async def update(id: int, data: ImageDTO.Image, db: AsyncSession) -> Image | None:
     """
     Обновление информации об изображении по id
     :param id: id изображении
@@ -91,57 +109,81 @@ def update(id: int, data: ImageDTO.Image, db: Session) -> Image | None:
     :return: изображение, если оно существует, в ином случае - None
     """
 
-    image = get_image_by_id(id, db)
+    image = await get_image_by_id(id, db)
     # Проверка соответствия нового статуса
     if image:
         # Обновляем только те поля, которые присутствуют в data
         for field, value in data.dict(exclude_unset=True).items():
             setattr(image, field, value)
+        image.blob_hash = await validate_image(image)
+        name, product_id = image.name, image.product_id
 
-        db.commit()
-        db.refresh(image)
+        try:
+            await db.commit()
+        except IntegrityError:
+            await db.rollback()
+            raise await _integrity_error(id, name, product_id, db)
+        await db.refresh(image)
 
         return image
     return None
 
 
-def remove(id: int, db: Session) -> int | None:
+async def remove(id: int, db: AsyncSession) -> int | None:
     """
     Удаляем изображение по id
     :param id: id изображения
     :param db: сессия/бд
-    :return: кол-во удаленных строк, если изображение существует, иначе None
+    :return: удаленное изображение, если оно существует, иначе None (файл освобождается вызывающим через storage.release_files)
     """
-    image = db.query(Image).filter(Image.id == id).first()
+    image = await db.scalar(select(Image).where(Image.id == id))
 
     if image:
-        db.delete(image)
-        db.commit()
+        await db.delete(image)
+        await db.commit()
 
     return image
 
 
-def upload_image(file: UploadFile = File(...)) -> None:
-    # Получаем абсолютный путь к файлу относительно текущей директории проекта
-    base_dir = os.path.dirname(os.path.abspath(__file__))  # Путь к текущему файлу
-    file_path = os.path.join(base_dir, "../..", "react", "React-shop", "public", "img",
-                             str(file.filename))  # Путь к изображению
+async def get_image_source(image: Image) -> tuple[str, str]:
+    """
+    Путь к файлу изображения и идентификатор его содержимого для кэша копий
+    :param image: изображение
+    :return: путь к файлу и идентификатор (хеш содержимого либо имя, размер и время изменения файла)
+    """
+    # Записи, созданные до проверки имени, не должны открывать файлы за пределами папки изображений
+    _check_name(str(image.name))
+    file_path = os.path.join(config.IMAGES_DIR, str(image.name))
+    if image.blob_hash:
+        # Одинаковое содержимое под разными именами использует одни и те же копии
+        return storage.blob_path(image.blob_hash), image.blob_hash
+
+    try:
+        stat = await run_in_threadpool(os.stat, file_path)
+    except FileNotFoundError:
+        raise HTTPException(status_code=400, detail=f"File not exists")
+
+    return file_path, f"{image.name}:{stat.st_size}:{stat.st_mtime_ns}"
+
 
-    # Проверки
-    if not os.path.exists(os.path.join(base_dir, "../..", "react", "React-shop", "public", "img")):
-        raise HTTPException(status_code=400, detail=f"Path not exists")
+async def upload_image(request: Request, db: AsyncSession) -> str:
+    """
+    Сохранение загруженного изображения в папку public/img.
+    Файл читается из тела запроса потоком (см. upload), размер ограничивается IMAGE_MAX_SIZE до и во время чтения.
+    Содержимое хранится один раз по своему SHA-256 (см. storage), имя файла ссылается на него
+    :param request: запрос с файлом в поле file формы multipart/form-data
+    :param db: бд, сессия
+    :return: имя сохраненного файла
+    """
+    file_name, chunks = await upload.open_file(request, config.IMAGE_MAX_SIZE)
+    # Только имя файла, без каталогов из имени, присланного клиентом
+    file_name = os.path.basename(file_name)
 
-        # Проверка типа файла
+    # Проверка типа файла
     allowed_extensions = {".jpg", ".jpeg", ".png"}  # Разрешенные расширения файлов
-    _, file_extension = os.path.splitext(str(file.filename))  # Получаем расширение файла из
+    _, file_extension = os.path.splitext(file_name)  # Получаем расширение файла из имени
     if file_extension.lower() not in allowed_extensions:
         raise HTTPException(status_code=400, detail=f"Not allowed type of file")
 
-    # Проверка уникальности имени файла
-    if os.path.exists(file_path):
-        raise HTTPException(status_code=400, detail=f"File already exists")
-
-    # Сохраняем файл в папку public/img с тем же именем, что у файла
-    with open(file_path, "wb") as buffer:
-        buffer.write(file.file.read())
-
+    await storage.store(chunks, file_name, db)
+    return file_name
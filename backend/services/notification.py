@@ -0,0 +1,293 @@
+import asyncio
+import logging
+from typing import Awaitable, Callable, Optional
+
+import asyncpg
+from sqlalchemy import select, func, make_url, event
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession
+from sqlalchemy.orm import Session
+from starlette.websockets import WebSocket
+
+from backend import config, metrics
+
+"""
+Шина уведомлений между воркерами uvicorn.
+В PostgreSQL события передаются через LISTEN/NOTIFY, для остальных СУБД (SQLite в тестах) - в памяти процесса.
+Каждый воркер подписан на шину и раскладывает сообщения о покупках по очередям своих WebSocket менеджеров.
+"""
+
+logger = logging.getLogger("backend.notifications")
+
+# Канал сообщений о покупках
+PURCHASES_CHANNEL = "purchases"
+
+# Максимальное число неотправленных сообщений в очереди одного сокета
+SOCKET_QUEUE_SIZE = 100
+
+# Сообщение NOTIFY должно быть короче 8000 байт, длинное сообщение о покупке обрезается
+MAX_MESSAGE_SIZE = 7999
+
+# Ключ session.info со списком сообщений, ожидающих фиксации транзакции
+_PENDING = "pending_messages"
+
+# Паузы между попытками восстановить соединение прослушивания, секунды
+RECONNECT_DELAY = 1.0
+RECONNECT_MAX_DELAY = 30.0
+
+Handler = Callable[[str], None]
+ReconnectHandler = Callable[[], Awaitable[None]]
+
+
+class Broker:
+    """
+    Базовый класс брокера сообщений (pub/sub)
+    """
+
+    def __init__(self):
+        self._handlers: dict[str, list[Handler]] = {}
+        self._reconnect_handlers: list[ReconnectHandler] = []
+
+    async def subscribe(self, channel: str, handler: Handler) -> None:
+        """
+        Подписка на канал. Обработчик вызывается синхронно и не должен блокировать цикл событий
+        :param channel: имя канала
+        :param handler: обработчик сообщения
+        """
+        self._handlers.setdefault(channel, []).append(handler)
+
+    def on_reconnect(self, handler: ReconnectHandler) -> None:
+        """
+        Регистрация действия после восстановления прерванной подписки.
+        Сообщения, отправленные за время обрыва, не доставляются, поэтому подписчик должен
+        заново загрузить свое состояние
+        :param handler: обработчик
+        """
+        self._reconnect_handlers.append(handler)
+
+    async def publish(self, channel: str, message: str) -> None:
+        """
+        Публикация сообщения в канал для всех воркеров
+        :param channel: имя канала
+        :param message: сообщение
+        """
+        raise NotImplementedError
+
+    async def publish_in(self, db: AsyncSession, channel: str, message: str) -> None:
+        """
+        Публикация сообщения в транзакции сессии: сообщение доставляется после фиксации транзакции,
+        при откате не отправляется
+        :param db: бд, сессия с открытой транзакцией
+        :param channel: имя канала
+        :param message: сообщение
+        """
+        raise NotImplementedError
+
+    async def close(self) -> None:
+        """
+        Закрытие соединений брокера
+        """
+
+    def _dispatch(self, channel: str, message: str) -> None:
+        for handler in self._handlers.get(channel, []):
+            handler(message)
+
+
+class InProcessBroker(Broker):
+    """
+    Брокер в памяти процесса (для тестов и запуска с одним воркером)
+    """
+
+    async def publish(self, channel: str, message: str) -> None:
+        self._dispatch(channel, message)
+
+    async def publish_in(self, db: AsyncSession, channel: str, message: str) -> None:
+        db.sync_session.info.setdefault(_PENDING, []).append((self, channel, message))
+
+
+@event.listens_for(Session, "after_commit")
+def _send_pending(session: Session) -> None:
+    for broker, channel, message in session.info.pop(_PENDING, ()):
+        broker._dispatch(channel, message)
+
+
+@event.listens_for(Session, "after_transaction_end")
+def _drop_pending(session: Session, transaction) -> None:
+    # Откат внешней транзакции отменяет и ее сообщения
+    if transaction.parent is None:
+        session.info.pop(_PENDING, None)
+
+
+class PostgresBroker(Broker):
+    """
+    Брокер на PostgreSQL LISTEN/NOTIFY.
+    Для прослушивания держит одно отдельное соединение asyncpg (к listen_url, если задан), публикация идет через общий пул.
+    Оборванное соединение прослушивания переоткрывается с подпиской на все каналы
+    """
+
+    def __init__(self, engine: AsyncEngine, listen_url: Optional[str] = None):
+        super().__init__()
+        self._engine = engine
+        self._listen_url = make_url(listen_url) if listen_url else engine.url
+        self._connection: Optional[asyncpg.Connection] = None
+        self._reconnecting: Optional[asyncio.Task] = None
+        self._closed = False
+
+    async def _connect(self) -> None:
+        url = self._listen_url.set(drivername="postgresql", query={})
+        connection = await asyncpg.connect(url.render_as_string(hide_password=False))
+        try:
+            for channel in self._handlers:
+                await connection.add_listener(channel, self._on_notification)
+        except BaseException:
+            await connection.close()
+            raise
+        connection.add_termination_listener(self._on_termination)
+        self._connection = connection
+
+    def _on_termination(self, connection: asyncpg.Connection) -> None:
+        if self._closed or connection is not self._connection:
+            return
+        logger.warning("LISTEN connection lost, reconnecting")
+        self._connection = None
+        self._reconnecting = asyncio.create_task(self._reconnect())
+
+    async def _reconnect(self) -> None:
+        delay = RECONNECT_DELAY
+        while not self._closed:
+            try:
+                await self._connect()
+                break
+            except (OSError, asyncpg.PostgresError) as e:
+                logger.warning("LISTEN reconnect failed: %s, retrying in %.0f s", e, delay)
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, RECONNECT_MAX_DELAY)
+        else:
+            return
+
+        logger.info("LISTEN connection restored")
+        # Подписка восстановлена до перезагрузки состояния, поэтому изменения после нее не теряются
+        for handler in self._reconnect_handlers:
+            try:
+                await handler()
+            except Exception:
+                logger.exception("Reconnect handler %r failed", handler)
+
+    async def subscribe(self, channel: str, handler: Handler) -> None:
+        if self._connection is None and self._reconnecting is None:
+            await self._connect()
+
+        if channel not in self._handlers and self._connection is not None:
+            await self._connection.add_listener(channel, self._on_notification)
+        await super().subscribe(channel, handler)
+
+    async def publish(self, channel: str, message: str) -> None:
+        async with self._engine.begin() as conn:
+            await conn.execute(select(func.pg_notify(channel, message)))
+
+    async def publish_in(self, db: AsyncSession, channel: str, message: str) -> None:
+        # NOTIFY транзакционный: PostgreSQL доставит сообщение при COMMIT, отдельное соединение не нужно
+        await db.execute(select(func.pg_notify(channel, message)))
+
+    async def close(self) -> None:
+        self._closed = True
+        if self._reconnecting is not None:
+            self._reconnecting.cancel()
+            self._reconnecting = None
+        if self._connection is not None:
+            await self._connection.close()
+            self._connection = None
+
+    def _on_notification(self, connection, pid: int, channel: str, payload: str) -> None:
+        self._dispatch(channel, payload)
+
+
+class ManagerConnections:
+    """
+    WebSocket соединения менеджеров текущего воркера.
+    У каждого сокета своя очередь и своя задача отправки, поэтому медленный клиент
+    не задерживает ни покупку, ни рассылку остальным менеджерам
+    """
+
+    def __init__(self, queue_size: int = SOCKET_QUEUE_SIZE):
+        self._queue_size = queue_size
+        self._senders: dict[WebSocket, tuple[asyncio.Queue, asyncio.Task]] = {}
+
+    def __len__(self) -> int:
+        return len(self._senders)
+
+    def connect(self, websocket: WebSocket) -> None:
+        """
+        Регистрация принятого соединения
+        :param websocket: сокет менеджера
+        """
+        queue = asyncio.Queue(maxsize=self._queue_size)
+        task = asyncio.create_task(self._send_loop(websocket, queue))
+        self._senders[websocket] = (queue, task)
+        metrics.WEBSOCKET_CONNECTIONS.set(len(self._senders))
+
+    def disconnect(self, websocket: WebSocket) -> None:
+        """
+        Удаление соединения и остановка его задачи отправки
+        :param websocket: сокет менеджера
+        """
+        sender = self._senders.pop(websocket, None)
+        if sender:
+            sender[1].cancel()
+        metrics.WEBSOCKET_CONNECTIONS.set(len(self._senders))
+
+    def broadcast(self, message: str) -> None:
+        """
+        Постановка сообщения в очереди всех сокетов без ожидания отправки.
+        Если очередь сокета переполнена, самое старое сообщение отбрасывается
+        :param message: сообщение
+        """
+        for queue, _ in self._senders.values():
+            if queue.full():
+                queue.get_nowait()
+            queue.put_nowait(message)
+
+    async def _send_loop(self, websocket: WebSocket, queue: asyncio.Queue) -> None:
+        try:
+            while True:
+                message = await queue.get()
+                await websocket.send_text(message)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            logger.warning("Manager socket send failed, disconnecting", exc_info=True)
+            self._senders.pop(websocket, None)
+            metrics.WEBSOCKET_CONNECTIONS.set(len(self._senders))
+
+
+manager_connections = ManagerConnections()
+broker: Broker = InProcessBroker()
+
+
+async def start(engine: AsyncEngine) -> None:
+    """
+    Запуск шины при старте воркера: выбор брокера по СУБД и подписка на покупки
+    :param engine: движок бд
+    """
+    global broker
+    broker = PostgresBroker(engine, config.DATABASE_LISTEN_URL) if engine.dialect.name == "postgresql" else InProcessBroker()
+    await broker.subscribe(PURCHASES_CHANNEL, manager_connections.broadcast)
+
+
+async def stop() -> None:
+    """
+    Остановка шины при завершении воркера
+    """
+    await broker.close()
+
+
+async def notify_purchase(message: str, db: AsyncSession) -> None:
+    """
+    Отправка сообщения о покупке менеджерам всех воркеров в транзакции покупки:
+    сообщение уходит вместе с фиксацией покупки и не требует отдельного соединения с бд
+    :param message: сообщение
+    :param db: бд, сессия покупки до фиксации
+    """
+    data = message.encode()
+    if len(data) > MAX_MESSAGE_SIZE:
+        message = data[:MAX_MESSAGE_SIZE - len("…".encode())].decode(errors="ignore") + "…"
+    await broker.publish_in(db, PURCHASES_CHANNEL, message)
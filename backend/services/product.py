@@ -1,15 +1,92 @@
-from typing import Optional, Type, Tuple, List
+import base64
+import json
+from typing import Optional, Tuple, Sequence, Any, List
 
 from fastapi import HTTPException
-from sqlalchemy.orm import Session, joinedload
-from backend.dto import product as ProductDTO
+from sqlalchemy import Select, select, func, case, delete, tuple_, update as sql_update
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import joinedload, selectinload
+from backend import metrics
+from backend.database import read_columns
+from backend.dto import product as ProductDTO, image as ImageDTO, category as CategoryDTO, brand as BrandDTO
+from backend.models.brand import Brand
+from backend.models.category import Category
+from backend.models.image import Image
 from backend.models.product import Product
 
 from backend.services.category import get_category
 from backend.services.brand import get_brand_by_id
+from backend.services.search import get_search_index
+from backend.services.cache import TTLCache, invalidate
+from backend.services import counters as CounterService, notification as NotificationService
+
+# Время жизни закэшированного общего количества товаров (в секундах) для курсорной пагинации
+COUNT_CACHE_TTL = 30.0
+
+# Кэш общего количества товаров: (поисковая строка, фильтры) -> количество.
+# Ключи приходят от клиента, поэтому размер кэша ограничен, давно не использованные вытесняются
+count_cache = TTLCache("product_count", maxsize=1024, ttl=COUNT_CACHE_TTL)
+
+# Колонки товаров и связанных данных в ответах API: чтение каталога идет выборкой колонок прямо в DTO,
+# без объектов ORM и карты идентичности сессии
+PRODUCT_FIELDS = list(ProductDTO.ProductRecord.model_fields)
+PRODUCT_COLUMNS = [getattr(Product, field) for field in PRODUCT_FIELDS]
+IMAGE_COLUMNS = read_columns(Image, ImageDTO.ImageRead)
+CATEGORY_COLUMNS = read_columns(Category, CategoryDTO.CategoryRead)
+BRAND_COLUMNS = read_columns(Brand, BrandDTO.BrandRead)
+
+# Связи товара, которые можно запросить через ?include=
+RELATIONS = ("images", "category", "brand")
+
+# Сортировки списка товаров: имя -> (колонки ключа сортировки, по убыванию).
+# Ключ заканчивается на id, чтобы порядок был однозначным и по нему работала курсорная пагинация;
+# сортировки по цене используют составные индексы (category_id/brand_id, price, id) и (price, id)
+SORTS = {
+    "id": ((Product.id,), False),
+    "price": ((Product.price, Product.id), False),
+    "-price": ((Product.price, Product.id), True),
+    "title": ((Product.title, Product.id), False),
+    "newest": ((Product.id,), True),
+}
+
+
+def apply_filters(query: Select, filters: Optional[ProductDTO.ProductFilter], by_category: bool = True,
+                  by_brand: bool = True) -> Select:
+    """
+    Добавление фильтров к запросу по таблице products
+    :param query: запрос
+    :param filters: фильтры (None - без фильтров)
+    :param by_category: фильтровать по категориям (для фасетов фильтр по своему полю не применяется)
+    :param by_brand: фильтровать по брендам
+    :return: запрос с условиями
+    """
+    if filters is None:
+        return query
+    if by_category and filters.category_id:
+        query = query.where(Product.category_id.in_(filters.category_id))
+    if by_brand and filters.brand_id:
+        query = query.where(Product.brand_id.in_(filters.brand_id))
+    if filters.price_min is not None:
+        query = query.where(Product.price >= filters.price_min)
+    if filters.price_max is not None:
+        query = query.where(Product.price <= filters.price_max)
+    if filters.in_stock is not None:
+        query = query.where(Product.count > 0 if filters.in_stock else Product.count == 0)
+    return query
+
+
+def order_by_sort(query: Select, sort: str) -> Select:
+    """
+    Сортировка запроса по ключу из SORTS
+    :param query: запрос
+    :param sort: имя сортировки
+    :return: упорядоченный запрос
+    """
+    columns, descending = SORTS[sort]
+    return query.order_by(*(column.desc() if descending else column for column in columns))
 
 
-def validate_product(product: Product, db) -> bool:
+async def validate_product(product: Product, db: AsyncSession) -> bool:
     if int(product.count) < 0:
         raise HTTPException(status_code=400, detail="Count should be >= 0")
 
@@ -17,19 +94,19 @@ def validate_product(product: Product, db) -> bool:
         raise HTTPException(status_code=400, detail="Price should be > 0")
 
     # Проверяем существование категории
-    category = get_category(product.category_id, db)
+    category = await get_category(product.category_id, db)
     if not category:
         raise HTTPException(status_code=404, detail=f"Category with id {product.category_id} does not exist")
 
     # Проверяем существование брендов
-    brand = get_brand_by_id(product.brand_id, db)
+    brand = await get_brand_by_id(product.brand_id, db)
     if not brand:
         raise HTTPException(status_code=404, detail=f"Brand with id {product.brand_id} does not exist")
 
     return True
 
 
-def create_product(data: ProductDTO.Product, db: Session) -> Product:
+async def create_product(data: ProductDTO.Product, db: AsyncSession) -> Product:
     """
     Создание продукта
     :param data: данные об
@@ -38,21 +115,25 @@ def create_product(data: ProductDTO.Product, db: Session) -> Product:
     """
 
     # Проверка данных о продукте
-    validate_product(data, db)
+    await validate_product(data, db)
 
     product = Product(**data.dict())
 
     try:
         db.add(product)
-        db.commit()
-        db.refresh(product)
+        await CounterService.adjust(CounterService.count_changes(
+            added=[CounterService.counter_key(product.category_id, product.brand_id, product.count)]
+        ), db)
+        await db.commit()
+        await db.refresh(product)
+        get_search_index(db).add(product.id, product.title, product.description)
     except Exception as e:
         print(e)
 
     return product
 
 
-def get_product(id: int, db: Session) -> Product | None:
+async def get_product(id: int, db: AsyncSession) -> Product | None:
     """
     Получение 1 продукта по id
     :param id: id продукта
@@ -60,47 +141,322 @@ def get_product(id: int, db: Session) -> Product | None:
     :return: Полученный продукт
     """
     # joinedload, чтобы вывести список images, которые ссылаются на этот продукт
-    product = db.query(Product).options(joinedload(Product.images)).filter(Product.id == id).first()
-    return product
+    result = await db.execute(select(Product).options(joinedload(Product.images)).where(Product.id == id))
+    return result.unique().scalars().first()
+
 
+def _names(value: str) -> list[str]:
+    return list(dict.fromkeys(name.strip() for name in value.split(",") if name.strip()))
 
-def get_products(db: Session, skip: int = 0, limit: int = 10, search_query: Optional[str] = None) -> Tuple[
-    List[Type[Product]], int]:
+
+def parse_fieldset(fields: Optional[str] = None, include: Optional[str] = None) -> ProductDTO.ProductFieldset:
+    """
+    Разбор параметров ?fields= и ?include=
+    :param fields: поля товара через запятую (None - все поля)
+    :param include: связи через запятую из RELATIONS (None - только изображения, пустая строка - без связей)
+    :return: запрошенные поля и связи
+    """
+    fieldset = ProductDTO.ProductFieldset()
+    if fields is not None:
+        fieldset.fields = _names(fields)
+        unknown = [name for name in fieldset.fields if name not in PRODUCT_FIELDS]
+        if unknown:
+            raise HTTPException(status_code=400, detail=f"Unknown fields: {', '.join(unknown)}")
+    if include is not None:
+        fieldset.include = _names(include)
+        unknown = [name for name in fieldset.include if name not in RELATIONS]
+        if unknown:
+            raise HTTPException(status_code=400, detail=f"Unknown relations: {', '.join(unknown)}")
+    return fieldset
+
+
+def product_columns(fieldset: Optional[ProductDTO.ProductFieldset] = None, *required) -> list:
+    """
+    Колонки выборки товаров: запрошенные поля и служебные - id и updated_at (загрузка связей и ETag),
+    внешние ключи запрошенных связей и колонки ключа сортировки (курсор). Служебные поля в ответ не попадают
+    :param fieldset: запрошенные поля и связи (None - все поля)
+    :param required: дополнительные колонки
+    :return: колонки таблицы products в порядке PRODUCT_COLUMNS
+    """
+    fieldset = fieldset or ProductDTO.ProductFieldset()
+    names = {*(PRODUCT_FIELDS if fieldset.fields is None else fieldset.fields), "id", "updated_at",
+             *(column.key for column in required)}
+    if "category" in fieldset.include:
+        names.add("category_id")
+    if "brand" in fieldset.include:
+        names.add("brand_id")
+    return [column for column in PRODUCT_COLUMNS if column.key in names]
+
+
+async def read_products(query: Select, db: AsyncSession,
+                        fieldset: Optional[ProductDTO.ProductFieldset] = None) -> list[ProductDTO.ProductView]:
+    """
+    Выполнение запроса по колонкам product_columns и сборка DTO товаров.
+    Каждая запрошенная связь загружается для всех товаров одним дополнительным запросом WHERE ... IN (...)
+    :param query: запрос select(*product_columns(fieldset)) с условиями, сортировкой и пагинацией
+    :param db: бд, сессия
+    :param fieldset: запрошенные поля и связи (None - все поля и изображения)
+    :return: товары в порядке запроса
+    """
+    fieldset = fieldset or ProductDTO.ProductFieldset()
+    rows = (await db.execute(query)).all()
+    if not rows:
+        return []
+
+    related: dict[str, dict] = {}
+    if "images" in fieldset.include:
+        images: dict[int, list[ImageDTO.ImageRead]] = {row.id: [] for row in rows}
+        image_rows = await db.execute(select(*IMAGE_COLUMNS).where(Image.product_id.in_(images)).order_by(Image.id))
+        for row in image_rows:
+            images[row.product_id].append(ImageDTO.ImageRead.model_construct(**row._mapping))
+        related["images"] = images
+    if "category" in fieldset.include:
+        category_rows = await db.execute(
+            select(*CATEGORY_COLUMNS).where(Category.id.in_({row.category_id for row in rows}))
+        )
+        related["category"] = {
+            row.id: CategoryDTO.CategoryRead.model_construct(**row._mapping) for row in category_rows
+        }
+    if "brand" in fieldset.include:
+        brand_rows = await db.execute(select(*BRAND_COLUMNS).where(Brand.id.in_({row.brand_id for row in rows})))
+        related["brand"] = {row.id: BrandDTO.BrandRead.model_construct(**row._mapping) for row in brand_rows}
+
+    # Ключ связи в строке товара: изображения - по id товара, категория и бренд - по внешнему ключу
+    keys = {"images": "id", "category": "category_id", "brand": "brand_id"}
+    # Выводятся только запрошенные поля; значения колонок уже имеют нужные типы, проверка pydantic не нужна
+    visible = {*(PRODUCT_FIELDS if fieldset.fields is None else fieldset.fields), *fieldset.include}
+    products = []
+    for row in rows:
+        values = dict(row._mapping)
+        for relation, objects in related.items():
+            values[relation] = objects.get(values[keys[relation]])
+        products.append(ProductDTO.ProductView.model_construct(_fields_set=visible, **values))
+    return products
+
+
+async def read_product(id: int, db: AsyncSession,
+                       fieldset: Optional[ProductDTO.ProductFieldset] = None) -> ProductDTO.ProductView | None:
+    """
+    Получение 1 товара для ответа API
+    :param id: id продукта
+    :param db: бд сессия
+    :param fieldset: запрошенные поля и связи (None - все поля и изображения)
+    :return: товар или None, если он не существует
+    """
+    products = await read_products(select(*product_columns(fieldset)).where(Product.id == id), db, fieldset)
+    return products[0] if products else None
+
+
+def product_versions(products: Sequence[ProductDTO.ProductView]) -> list:
+    """
+    Строки, из которых состоит ответ со списком товаров (для ETag): товары и загруженные связи
+    :param products: товары
+    :return: товары, изображения, категории и бренды
+    """
+    rows = []
+    for product in products:
+        rows.append(product)
+        rows.extend(product.images or ())
+        rows.extend(row for row in (product.category, product.brand) if row is not None)
+    return rows
+
+
+async def get_products(db: AsyncSession, skip: int = 0, limit: int = 10, search_query: Optional[str] = None,
+                       filters: Optional[ProductDTO.ProductFilter] = None, sort: Optional[str] = None,
+                       fieldset: Optional[ProductDTO.ProductFieldset] = None) -> Tuple[
+    Sequence[ProductDTO.ProductView], int]:
     """
     Получение списка продуктов
-    :param search_query: Поиск по строке в названии
+    :param search_query: Полнотекстовый поиск по названию и описанию
     :param limit: Конец пагинации
     :param skip: Начало пагинации
     :param db: бд, сессия
+    :param filters: Фильтры по категории, бренду, цене и наличию
+    :param sort: Сортировка из SORTS (по умолчанию - по релевантности при поиске, иначе по id)
+    :param fieldset: Запрошенные поля и связи товаров
     :return: список товаров
     """
-    query = db.query(Product).options(joinedload(Product.images))
+    query = apply_filters(select(*product_columns(fieldset)), filters)
+    ranked_query = query
 
     if search_query:
-        query = query.filter(Product.title.ilike(f"%{search_query}%"))
-
+        query = get_search_index(db).filter(query, search_query)
+        # Без явной сортировки результаты поиска сортируются по релевантности, при равенстве - по id
+        ranked_query = get_search_index(db).filter(ranked_query, search_query, ranked=sort is None)
 
-    products = query.order_by(Product.id).offset(skip).limit(limit).all()
-    total_count = query.count()  # Получаем общее количество товаров
+    # Пагинация идет по строкам products без join, изображения страницы подгружаются вторым запросом
+    products = await read_products(order_by_sort(ranked_query, sort or "id").offset(skip).limit(limit), db,
+                                   fieldset)
+    # Получаем общее количество товаров (по счетчикам, если их хватает для фильтров)
+    if CounterService.covers(filters, search_query):
+        total_count = await CounterService.count(db, filters)
+    else:
+        total_count = await db.scalar(query.with_only_columns(func.count(Product.id)))
 
 
     return products, total_count
 
 
-def get_count_products(db: Session) -> int:
+def encode_cursor(values: list[Any]) -> str:
     """
-    Получение количества продуктов
+    Кодирование ключа последней строки страницы в непрозрачный курсор
+    :param values: значения ключа сортировки последнего товара
+    :return: курсор
+    """
+    raw = json.dumps(values, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> list[Any]:
+    """
+    Декодирование курсора, полученного от encode_cursor
+    :param cursor: курсор
+    :return: значения ключа сортировки
+    """
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+    if not isinstance(values, list):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return values
+
+
+async def count_products_cached(db: AsyncSession, search_query: Optional[str] = None,
+                                filters: Optional[ProductDTO.ProductFilter] = None) -> int:
+    """
+    Получение общего количества товаров с кэшированием на COUNT_CACHE_TTL секунд
     :param db: бд, сессия
+    :param search_query: Полнотекстовый поиск по названию и описанию
+    :param filters: Фильтры по категории, бренду, цене и наличию
     :return: количество товаров
     """
-    query = db.query(Product)
+    # Без поиска и фильтров по цене количество читается из счетчиков, кэш не нужен
+    if CounterService.covers(filters, search_query):
+        return await CounterService.count(db, filters)
 
-    total_count = query.count()  # Получаем общее количество товаров
+    key = (search_query, filters.model_dump_json() if filters else None)
+    cached = count_cache.get(key)
+    if cached is not None:
+        return cached
+
+    query = apply_filters(select(func.count(Product.id)), filters)
+    if search_query:
+        query = get_search_index(db).filter(query, search_query)
 
+    total_count = await db.scalar(query)
+    count_cache.set(key, total_count)
     return total_count
 
 
-def update(id: int, data: ProductDTO.Product, db: Session) -> Product | None:
+async def reset_count_cache() -> None:
+    """
+    Сброс закэшированных количеств товаров во всех воркерах после массового изменения каталога
+    """
+    await invalidate(count_cache)
+
+
+async def get_products_page(db: AsyncSession, after_id: Optional[str] = None, limit: int = 10,
+                            search_query: Optional[str] = None, with_count: bool = False,
+                            filters: Optional[ProductDTO.ProductFilter] = None, sort: str = "id",
+                            fieldset: Optional[ProductDTO.ProductFieldset] = None) -> dict:
+    """
+    Получение страницы продуктов курсорной (keyset) пагинацией по ключу сортировки
+    :param db: бд, сессия
+    :param after_id: курсор из next_cursor предыдущей страницы, пустая строка - первая страница
+    :param limit: Размер страницы
+    :param search_query: Полнотекстовый поиск по названию и описанию
+    :param with_count: Вернуть общее количество товаров (кэшируется)
+    :param filters: Фильтры по категории, бренду, цене и наличию
+    :param sort: Сортировка из SORTS, курсор действителен только для той же сортировки
+    :param fieldset: Запрошенные поля и связи товаров
+    :return: словарь с товарами (items), курсором следующей страницы (next_cursor) и количеством (total)
+    """
+    columns, descending = SORTS[sort]
+    query = apply_filters(select(*product_columns(fieldset, *columns)), filters)
+
+    # В курсорном режиме результаты поиска упорядочены по ключу сортировки, а не по релевантности
+    if search_query:
+        query = get_search_index(db).filter(query, search_query)
+
+    if after_id:
+        values = decode_cursor(after_id)
+        try:
+            if len(values) != len(columns):
+                raise ValueError
+            values = [column.type.python_type(value) for column, value in zip(columns, values)]
+        except (TypeError, ValueError):
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+        # Сравнение кортежей (price, id) > (:price, :id) - продолжение с позиции последней строки по индексу
+        key, last = (tuple_(*columns), tuple_(*values)) if len(columns) > 1 else (columns[0], values[0])
+        query = query.where(key < last if descending else key > last)
+
+    # Берем на одну строку больше, чтобы узнать, есть ли следующая страница
+    products = await read_products(order_by_sort(query, sort).limit(limit + 1), db, fieldset)
+
+    next_cursor = None
+    if len(products) > limit:
+        products = products[:limit]
+        next_cursor = encode_cursor([getattr(products[-1], column.key) for column in columns])
+
+    total_count = await count_products_cached(db, search_query, filters) if with_count else None
+
+    return {"items": products, "next_cursor": next_cursor, "total": total_count}
+
+
+async def get_facets(db: AsyncSession, filters: Optional[ProductDTO.ProductFilter] = None,
+                     search_query: Optional[str] = None) -> dict:
+    """
+    Количество товаров по категориям и брендам для фильтров каталога.
+    Один запрос с группировкой по паре (категория, бренд) без фильтров по категории и бренду:
+    количество по категории учитывает выбранные бренды, а по бренду - выбранные категории,
+    поэтому можно видеть, сколько товаров добавит выбор еще одной категории или бренда
+    :param db: бд, сессия
+    :param filters: Фильтры по категории, бренду, цене и наличию
+    :param search_query: Полнотекстовый поиск по названию и описанию
+    :return: словарь с общим количеством (total) и списками {id, count} категорий (categories) и брендов (brands)
+    """
+    filters = filters or ProductDTO.ProductFilter()
+    if CounterService.covers(filters, search_query):
+        rows = await CounterService.pair_counts(db, filters)
+    else:
+        query = select(Product.category_id, Product.brand_id, func.count(Product.id)) \
+            .group_by(Product.category_id, Product.brand_id)
+        query = apply_filters(query, filters, by_category=False, by_brand=False)
+        if search_query:
+            query = get_search_index(db).filter(query, search_query)
+        rows = await db.execute(query)
+
+    total_count = 0
+    categories: dict[int, int] = {}
+    brands: dict[int, int] = {}
+    for category_id, brand_id, count in rows:
+        in_category = not filters.category_id or category_id in filters.category_id
+        in_brand = not filters.brand_id or brand_id in filters.brand_id
+        if in_brand:
+            categories[category_id] = categories.get(category_id, 0) + count
+        if in_category:
+            brands[brand_id] = brands.get(brand_id, 0) + count
+        if in_category and in_brand:
+            total_count += count
+
+    def facet(counts: dict[int, int]) -> list[dict]:
+        return [{"id": id, "count": count} for id, count in sorted(counts.items(), key=lambda item: (-item[1], item[0]))]
+
+    return {"total": total_count, "categories": facet(categories), "brands": facet(brands)}
+
+
+async def get_count_products(db: AsyncSession) -> int:
+    """
+    Получение количества продуктов
+    :param db: бд, сессия
+    :return: количество товаров
+    """
+    return await CounterService.count(db)
+
+
+async def update(id: int, data: ProductDTO.Product, db: AsyncSession) -> Product | None:
     """
     Обновление информации о продукте по id
     :param id: id продукта
@@ -108,9 +464,14 @@ def update(id: int, data: ProductDTO.Product, db: Session) -> Product | None:
     :param db: бд, сессия
     :return: Продукт, если он существует, в ином случае - None
     """
-    validate_product(data, db)
+    await validate_product(data, db)
 
-    product = get_product(id, db)
+    # Строка товара блокируется до изменения счетчиков - тот же порядок блокировок, что у покупки и удаления,
+    # а остаток читается из бд, а не из карты идентичности сессии
+    product = (await db.execute(
+        select(Product).options(joinedload(Product.images)).where(Product.id == id)
+        .with_for_update(of=Product).execution_options(populate_existing=True)
+    )).unique().scalars().first()
 
     # Проверка условий на соответствие роли пользователя со статусом задачи
     # performer = get_user_by_id(data.performer_id, db)
@@ -118,58 +479,158 @@ def update(id: int, data: ProductDTO.Product, db: Session) -> Product | None:
 
     # Проверка существования продукта
     if product:
+        before = CounterService.counter_key(product.category_id, product.brand_id, product.count)
         # Обновляем только те поля, которые присутствуют в data
         for field, value in data.dict(exclude_unset=True).items():
             setattr(product, field, value)
+        await db.flush()
 
-        db.commit()
-        db.refresh(product)
+        after = CounterService.counter_key(product.category_id, product.brand_id, product.count)
+        await CounterService.adjust(CounterService.count_changes(removed=[before], added=[after]), db)
+        await db.commit()
+        await db.refresh(product)
+        get_search_index(db).add(product.id, product.title, product.description)
 
         return product
     return None
 
 
-def remove(id: int, db: Session) -> int | None:
+async def remove_products(ids: Sequence[int], db: AsyncSession) -> tuple[Sequence[Product], list[tuple[str, Optional[str]]]]:
     """
-    Удаляем product по id
-    :param id: id product
+    Удаляем товары и их изображения двумя запросами в одной транзакции.
+    Файлы изображений не удаляются: их освобождение (storage.release_files) выполняется фоновой задачей
+    :param ids: id товаров
     :param db: сессия/бд
-    :return: кол-во удаленных строк, если продукт существует, иначе None
+    :return: удаленные товары и файлы их изображений (имя, SHA-256 содержимого)
     """
-    product = db.query(Product).filter(Product.id == id).first()
+    # Изображения удаляются явно, чтобы получить их файлы; ON DELETE CASCADE на images.product_id
+    # поддерживает целостность и для удалений в обход сервиса
+    files = (await db.execute(
+        delete(Image).where(Image.product_id.in_(ids)).returning(Image.name, Image.blob_hash)
+    )).tuples().all()
+    products = (await db.scalars(delete(Product).where(Product.id.in_(ids)).returning(Product))).all()
+    await CounterService.adjust(CounterService.count_changes(
+        removed=[CounterService.counter_key(product.category_id, product.brand_id, product.count) for product in products]
+    ), db)
+    await db.commit()
 
-    # Удаляем каждое изображение из базы данных
-    for image in product.images:
-        if image:
-            db.delete(image)
-            db.commit()
+    search_index = get_search_index(db)
+    for product in products:
+        search_index.remove(product.id)
 
-    if product:
-        db.delete(product)
-        db.commit()
+    return products, files
 
-    return product
+
+async def remove(id: int, db: AsyncSession) -> tuple[Product | None, list[tuple[str, Optional[str]]]]:
+    """
+    Удаляем product по id
+    :param id: id product
+    :param db: сессия/бд
+    :return: удаленный продукт (None, если продукт не существует) и файлы его изображений
+    """
+    products, files = await remove_products([id], db)
+    return (products[0] if products else None), files
 
 
-def buy_product(id: int, data: ProductDTO.ProductBuy, db: Session) -> Product | None:
+async def buy_product(id: int, data: ProductDTO.ProductBuy, db: AsyncSession,
+                      notification: Optional[str] = None) -> Product | None:
     """
-    Покупка продукта
+    Покупка продукта.
+    Остаток уменьшается одним условным UPDATE ... WHERE count >= :n RETURNING, поэтому
+    параллельные покупки одного товара не могут уйти в минус и не ждут друг друга дольше одного запроса
     :param id: id продукта
-    :param count: Количество, которое покупает пользователь
+    :param data: Количество, которое покупает пользователь
     :param db: бд, сессия
+    :param notification: сообщение о покупке для менеджеров, отправляется только при успешной покупке
     :return: Купленный продукт или None, если продукта не существует
     """
-    product = get_product(id, db)
+    if data.count <= 0:
+        raise HTTPException(status_code=400, detail="Count should be > 0")
+
+    product = await db.scalar(
+        sql_update(Product)
+        .where(Product.id == id, Product.count >= data.count)
+        .values(count=Product.count - data.count)
+        .returning(Product)
+        .options(selectinload(Product.images))
+    )
+
+    if product is None:
+        # Строка не обновилась: товара нет либо не хватает остатка
+        if await db.scalar(select(Product.id).where(Product.id == id)) is None:
+            return None
+        raise HTTPException(status_code=409, detail=f"Not enough products with id {id} in stock")
+
+    # Товар, купленный до последней единицы, переходит в счетчик "нет в наличии"
+    if product.count == 0:
+        await CounterService.adjust(CounterService.count_changes(
+            removed=[CounterService.counter_key(product.category_id, product.brand_id, data.count)],
+            added=[CounterService.counter_key(product.category_id, product.brand_id, 0)],
+        ), db)
+    if notification:
+        await NotificationService.notify_purchase(notification, db)
+    await db.commit()
+    metrics.PURCHASES.labels("single").inc()
+    metrics.PURCHASED_ITEMS.inc(data.count)
 
-    # Проверка существования продукта
-    if product:
-        product.count -= data.count
-
-        # Проверяем корректность данных
-        validate_product(product, db)
+    return product
 
-        db.commit()
-        db.refresh(product)
 
-        return product
-    return None
+async def buy_products(items: List[ProductDTO.ProductBuyItem], db: AsyncSession,
+                       notification: Optional[str] = None) -> Sequence[Product]:
+    """
+    Покупка нескольких продуктов одной транзакцией.
+    Строки блокируются в порядке id (одинаковый порядок во всех транзакциях исключает deadlock),
+    затем все остатки уменьшаются одним UPDATE; если хотя бы одного товара не хватает, покупка отменяется целиком
+    :param items: строки корзины (id товара и количество)
+    :param db: бд, сессия
+    :param notification: сообщение о покупке для менеджеров, отправляется только при успешной покупке
+    :return: Купленные продукты
+    """
+    counts: dict[int, int] = {}
+    for item in items:
+        if item.count <= 0:
+            raise HTTPException(status_code=400, detail="Count should be > 0")
+        counts[item.id] = counts.get(item.id, 0) + item.count
+
+    if not counts:
+        raise HTTPException(status_code=400, detail="Cart is empty")
+
+    ids = sorted(counts)
+    locked_ids = (await db.scalars(
+        select(Product.id).where(Product.id.in_(ids)).order_by(Product.id).with_for_update()
+    )).all()
+
+    missing_ids = sorted(set(ids) - set(locked_ids))
+    if missing_ids:
+        await db.rollback()
+        raise HTTPException(status_code=400, detail=f"Products with ids {missing_ids} not exist")
+
+    amount = case(counts, value=Product.id)
+    products = (await db.scalars(
+        sql_update(Product)
+        .where(Product.id.in_(ids), Product.count >= amount)
+        .values(count=Product.count - amount)
+        .returning(Product)
+        .options(selectinload(Product.images))
+    )).all()
+
+    if len(products) != len(ids):
+        short_ids = sorted(set(ids) - {product.id for product in products})
+        await db.rollback()
+        raise HTTPException(status_code=409, detail=f"Not enough products with ids {short_ids} in stock")
+
+    sold_out = [product for product in products if product.count == 0]
+    if sold_out:
+        await CounterService.adjust(CounterService.count_changes(
+            removed=[CounterService.counter_key(product.category_id, product.brand_id, counts[product.id])
+                     for product in sold_out],
+            added=[CounterService.counter_key(product.category_id, product.brand_id, 0) for product in sold_out],
+        ), db)
+    if notification:
+        await NotificationService.notify_purchase(notification, db)
+    await db.commit()
+    metrics.PURCHASES.labels("cart").inc()
+    metrics.PURCHASED_ITEMS.inc(sum(counts.values()))
+
+    return sorted(products, key=lambda product: product.id)
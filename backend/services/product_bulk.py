@@ -0,0 +1,196 @@
+import csv
+import io
+import json
+from typing import AsyncIterator, Any
+
+from fastapi import HTTPException
+from pydantic import ValidationError
+from sqlalchemy import select, insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from backend import config
+from backend.database import async_session_maker
+from backend.dto import product as ProductDTO
+from backend.models.brand import Brand
+from backend.models.category import Category
+from backend.models.product import Product
+from backend.services import product as ProductService, counters as CounterService
+from backend.services.search import get_search_index
+
+"""
+Массовая загрузка и выгрузка каталога товаров в форматах NDJSON (объект JSON на строку) и CSV (с заголовком).
+Загрузка читает тело запроса потоком и вставляет товары пачками по PRODUCT_IMPORT_BATCH_SIZE строк одним
+многострочным INSERT, выгрузка читает таблицу курсором бд, не загружая ее в память целиком.
+"""
+
+FORMATS = {"ndjson": "application/x-ndjson", "csv": "text/csv"}
+
+# Колонки выгрузки, в том же виде их принимает загрузка (id при загрузке игнорируется)
+EXPORT_COLUMNS = ["id", "title", "description", "count", "price", "category_id", "brand_id"]
+
+# Сколько ошибок строк возвращается в ответе загрузки
+MAX_REPORTED_ERRORS = 100
+
+
+def _decode(line: bytes) -> str | UnicodeDecodeError:
+    # Строка не в UTF-8 - ошибка этой строки, а не всей загрузки
+    try:
+        return line.decode().rstrip("\r")
+    except UnicodeDecodeError as e:
+        return e
+
+
+async def _lines(stream: AsyncIterator[bytes]) -> AsyncIterator[str | UnicodeDecodeError]:
+    buffer = b""
+    async for chunk in stream:
+        buffer += chunk
+        *lines, buffer = buffer.split(b"\n")
+        for line in lines:
+            yield _decode(line)
+    if buffer:
+        yield _decode(buffer)
+
+
+async def _records(stream: AsyncIterator[bytes], fmt: str) -> AsyncIterator[tuple[int, Any]]:
+    # Номер строки (с 1) и запись: словарь полей или исключение, если строку не удалось разобрать
+    number = 0
+    if fmt == "ndjson":
+        async for line in _lines(stream):
+            number += 1
+            if isinstance(line, UnicodeDecodeError):
+                yield number, line
+                continue
+            if not line.strip():
+                continue
+            try:
+                yield number, json.loads(line)
+            except ValueError as e:
+                yield number, e
+        return
+
+    header = None
+    record, start = "", 0
+    async for line in _lines(stream):
+        number += 1
+        if isinstance(line, UnicodeDecodeError):
+            if header is None:
+                raise HTTPException(status_code=400, detail=f"Invalid CSV header: {line}")
+            # Недекодируемая строка отбрасывает всю запись, в которой встретилась
+            yield (start if record else number), line
+            record = ""
+            continue
+        record, start = (record + "\n" + line, start) if record else (line, number)
+        # Значение в кавычках может содержать перевод строки: запись продолжается, пока кавычки не закрыты
+        if record.count('"') % 2:
+            continue
+
+        row, record = next(csv.reader([record])), ""
+        if header is None:
+            header = row
+        elif any(row):
+            yield start, dict(zip(header, row))
+
+
+async def import_products(stream: AsyncIterator[bytes], fmt: str, db: AsyncSession) -> dict:
+    """
+    Массовая загрузка товаров.
+    Категории и бренды проверяются по заранее загруженным множествам id, корректные строки вставляются пачками,
+    каждая пачка фиксируется своей транзакцией; некорректные строки пропускаются и попадают в отчет
+    :param stream: тело запроса
+    :param fmt: формат, ndjson или csv
+    :param db: бд, сессия
+    :return: количество вставленных и пропущенных товаров и ошибки первых MAX_REPORTED_ERRORS строк
+    """
+    if fmt not in FORMATS:
+        raise HTTPException(status_code=400, detail=f"Unsupported format {fmt}")
+
+    category_ids = set((await db.scalars(select(Category.id))).all())
+    brand_ids = set((await db.scalars(select(Brand.id))).all())
+    search_index = get_search_index(db)
+
+    inserted, failed, errors = 0, 0, []
+    batch: list[dict] = []
+
+    async def flush():
+        result = await db.execute(insert(Product).returning(Product.id, sort_by_parameter_order=True), batch)
+        ids = result.scalars().all()
+        await CounterService.adjust(CounterService.count_changes(
+            added=[CounterService.counter_key(row["category_id"], row["brand_id"], row["count"]) for row in batch]
+        ), db)
+        await db.commit()
+        # Индекс поиска обновляется только после фиксации, чтобы не находить товары отмененной пачки
+        for id, row in zip(ids, batch):
+            search_index.add(id, row["title"], row["description"])
+        batch.clear()
+
+    async for number, record in _records(stream, fmt):
+        try:
+            if isinstance(record, Exception):
+                raise record
+            if not isinstance(record, dict):
+                raise ValueError("Expected an object")
+
+            product = ProductDTO.Product(**record)
+            if product.count < 0:
+                raise ValueError("Count should be >= 0")
+            if product.price <= 0:
+                raise ValueError("Price should be > 0")
+            if product.category_id not in category_ids:
+                raise ValueError(f"Category with id {product.category_id} does not exist")
+            if product.brand_id not in brand_ids:
+                raise ValueError(f"Brand with id {product.brand_id} does not exist")
+        except ValidationError as e:
+            failed += 1
+            if len(errors) < MAX_REPORTED_ERRORS:
+                detail = "; ".join(f"{'.'.join(map(str, error['loc']))}: {error['msg']}" for error in e.errors())
+                errors.append({"line": number, "detail": detail})
+            continue
+        except ValueError as e:
+            failed += 1
+            if len(errors) < MAX_REPORTED_ERRORS:
+                errors.append({"line": number, "detail": str(e)})
+            continue
+
+        batch.append(product.dict())
+        if len(batch) >= config.PRODUCT_IMPORT_BATCH_SIZE:
+            inserted += len(batch)
+            await flush()
+
+    if batch:
+        inserted += len(batch)
+        await flush()
+
+    if inserted:
+        await ProductService.reset_count_cache()
+
+    return {"inserted": inserted, "failed": failed, "errors": errors}
+
+
+async def export_products(fmt: str) -> AsyncIterator[str]:
+    """
+    Потоковая выгрузка всех товаров по возрастанию id.
+    Открывает собственную сессию, так как ответ отправляется уже после завершения обработчика запроса
+    :param fmt: формат, ndjson или csv
+    :return: части выгрузки
+    """
+    columns = [getattr(Product, column) for column in EXPORT_COLUMNS]
+
+    if fmt == "csv":
+        buffer = io.StringIO()
+        writer = csv.writer(buffer, lineterminator="\n")
+        writer.writerow(EXPORT_COLUMNS)
+        yield buffer.getvalue()
+
+    async with async_session_maker() as db:
+        result = await db.stream(
+            select(*columns).order_by(Product.id).execution_options(yield_per=config.PRODUCT_EXPORT_BATCH_SIZE)
+        )
+        async for rows in result.partitions():
+            if fmt == "csv":
+                buffer = io.StringIO()
+                csv.writer(buffer, lineterminator="\n").writerows(rows)
+                yield buffer.getvalue()
+            else:
+                yield "".join(
+                    json.dumps(dict(zip(EXPORT_COLUMNS, row)), ensure_ascii=False) + "\n" for row in rows
+                )
@@ -0,0 +1,178 @@
+import bisect
+import re
+from collections import Counter
+from typing import Optional
+
+from sqlalchemy import Select, select, func, case, false, literal_column
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from backend.models.product import Product, search_document
+
+"""
+Полнотекстовый поиск товаров по названию и описанию.
+В PostgreSQL используется tsvector + GIN индекс ix_products_search, для остальных СУБД
+(например, SQLite в тестах) - инвертированный индекс в памяти процесса.
+"""
+
+
+def tokenize(text: Optional[str]) -> list[str]:
+    """
+    Разбиение строки на слова в нижнем регистре
+    :param text: строка
+    :return: список слов
+    """
+    return re.findall(r"\w+", (text or "").lower())
+
+
+class SearchIndex:
+    """
+    Базовый класс поискового индекса товаров
+    """
+
+    def filter(self, query: Select, search_query: str, ranked: bool = False) -> Select:
+        """
+        Добавление условия поиска к запросу
+        :param query: запрос по таблице products
+        :param search_query: поисковая строка, каждое слово ищется как префикс
+        :param ranked: отсортировать результат по релевантности
+        :return: запрос с условием поиска
+        """
+        raise NotImplementedError
+
+    async def build(self, db: AsyncSession) -> None:
+        """
+        Построение индекса по текущему содержимому таблицы products
+        :param db: бд, сессия
+        """
+
+    def add(self, id: int, title: str, description: str) -> None:
+        """
+        Добавление (или замена) товара в индексе
+        :param id: id товара
+        :param title: название товара
+        :param description: описание товара
+        """
+
+    def remove(self, id: int) -> None:
+        """
+        Удаление товара из индекса
+        :param id: id товара
+        """
+
+
+class PostgresSearchIndex(SearchIndex):
+    """
+    Поиск через to_tsvector/to_tsquery, индекс поддерживает сама СУБД
+    """
+
+    def filter(self, query: Select, search_query: str, ranked: bool = False) -> Select:
+        terms = tokenize(search_query)
+        if not terms:
+            return query
+
+        # Каждое слово ищется как префикс: "мол мак" -> 'мол:* & мак:*'
+        document = search_document(Product.title, Product.description)
+        ts_query = func.to_tsquery(literal_column("'simple'::regconfig"), " & ".join(f"{term}:*" for term in terms))
+        query = query.where(document.op("@@")(ts_query))
+        if ranked:
+            query = query.order_by(func.ts_rank(document, ts_query).desc())
+        return query
+
+
+class InMemorySearchIndex(SearchIndex):
+    """
+    Инвертированный индекс в памяти процесса: слово -> {id товара: число вхождений}
+    """
+
+    def __init__(self):
+        self._documents: dict[int, Counter] = {}
+        self._postings: dict[str, dict[int, int]] = {}
+        # Отсортированный список слов для поиска по префиксу
+        self._terms: list[str] = []
+
+    async def build(self, db: AsyncSession) -> None:
+        self.__init__()
+        rows = await db.execute(select(Product.id, Product.title, Product.description))
+        for id, title, description in rows:
+            self.add(id, title, description)
+
+    def add(self, id: int, title: str, description: str) -> None:
+        self.remove(id)
+
+        document = Counter(tokenize(title) + tokenize(description))
+        self._documents[id] = document
+        for term, count in document.items():
+            if term not in self._postings:
+                self._postings[term] = {}
+                bisect.insort(self._terms, term)
+            self._postings[term][id] = count
+
+    def remove(self, id: int) -> None:
+        document = self._documents.pop(id, None)
+        if not document:
+            return
+
+        for term in document:
+            postings = self._postings[term]
+            postings.pop(id, None)
+            if not postings:
+                del self._postings[term]
+                del self._terms[bisect.bisect_left(self._terms, term)]
+
+    def match(self, search_query: str) -> dict[int, int]:
+        """
+        Поиск товаров, содержащих все слова запроса (как префиксы)
+        :param search_query: поисковая строка
+        :return: словарь id товара -> релевантность
+        """
+        scores: Optional[dict[int, int]] = None
+        for term in tokenize(search_query):
+            term_scores: dict[int, int] = {}
+            position = bisect.bisect_left(self._terms, term)
+            while position < len(self._terms) and self._terms[position].startswith(term):
+                for id, count in self._postings[self._terms[position]].items():
+                    term_scores[id] = term_scores.get(id, 0) + count
+                position += 1
+
+            if scores is None:
+                scores = term_scores
+            else:
+                scores = {id: score + term_scores[id] for id, score in scores.items() if id in term_scores}
+
+        return scores or {}
+
+    def filter(self, query: Select, search_query: str, ranked: bool = False) -> Select:
+        if not tokenize(search_query):
+            return query
+
+        scores = self.match(search_query)
+        if not scores:
+            return query.where(false())
+
+        query = query.where(Product.id.in_(scores))
+        if ranked:
+            query = query.order_by(case(scores, value=Product.id, else_=0).desc())
+        return query
+
+
+# Поисковые индексы по имени диалекта СУБД, можно заменить через register_search_index
+search_indexes: dict[str, SearchIndex] = {"postgresql": PostgresSearchIndex()}
+fallback_search_index: SearchIndex = InMemorySearchIndex()
+
+
+def register_search_index(dialect: str, index: SearchIndex) -> None:
+    """
+    Регистрация поискового индекса для диалекта СУБД
+    :param dialect: имя диалекта (postgresql, sqlite, ...)
+    :param index: поисковый индекс
+    """
+    search_indexes[dialect] = index
+
+
+def get_search_index(db: AsyncSession) -> SearchIndex:
+    """
+    Получение поискового индекса для СУБД, к которой подключена сессия
+    :param db: бд, сессия
+    :return: поисковый индекс
+    """
+    return search_indexes.get(db.get_bind().dialect.name, fallback_search_index)
@@ -0,0 +1,280 @@
+import hashlib
+import os
+import tempfile
+from typing import AsyncIterator, Iterable, Optional
+
+from fastapi import HTTPException
+from sqlalchemy import delete, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+from starlette.concurrency import run_in_threadpool
+
+from backend import config
+from backend.database import async_session_maker
+from backend.models.blob import Blob
+from backend.services.notification import Broker
+
+"""
+Хранение файлов изображений по содержимому.
+Содержимое лежит один раз в public/img/.blobs/<2 символа хеша>/<sha256>, а файл public/img/<имя>
+является символьной ссылкой на него, поэтому фронтенд по-прежнему получает изображения по имени,
+а одинаковые файлы под разными именами не занимают место повторно. Таблица blobs считает ссылки на
+каждое содержимое; когда ссылок не остается, содержимое удаляется.
+
+Воркер держит в памяти индекс имен файлов папки (имя -> хеш содержимого), чтобы проверки имен при
+создании изображений не обращались к файловой системе. Индекс строится при запуске и обновляется при
+загрузке и удалении файлов, изменения рассылаются остальным воркерам через шину уведомлений.
+"""
+
+BLOBS_DIR_NAME = ".blobs"
+
+# Канал сообщений об изменении файлов папки изображений
+FILES_CHANNEL = "image_files"
+
+_MISSING = object()
+
+# Индекс папки изображений: имя файла -> SHA-256 содержимого (None для файлов, положенных вручную)
+_files: dict[str, Optional[str]] = {}
+
+_broker: Broker | None = None
+
+
+def blob_path(hash: str) -> str:
+    """
+    Путь к файлу содержимого
+    :param hash: SHA-256 содержимого
+    :return: путь
+    """
+    return os.path.join(config.IMAGES_DIR, BLOBS_DIR_NAME, hash[:2], hash)
+
+
+def _target_hash(target: str) -> Optional[str]:
+    parts = target.split(os.sep)
+    if len(parts) == 3 and parts[0] == BLOBS_DIR_NAME:
+        return parts[2]
+    return None
+
+
+def _probe(name: str) -> tuple[bool, Optional[str]]:
+    path = os.path.join(config.IMAGES_DIR, name)
+    if os.path.islink(path):
+        return True, _target_hash(os.readlink(path))
+    return os.path.isfile(path), None
+
+
+def _scan() -> dict[str, Optional[str]]:
+    files = {}
+    if not os.path.isdir(config.IMAGES_DIR):
+        return files
+
+    os.makedirs(os.path.join(config.IMAGES_DIR, BLOBS_DIR_NAME), exist_ok=True)
+    with os.scandir(config.IMAGES_DIR) as entries:
+        for entry in entries:
+            if entry.name.startswith("."):
+                continue
+            if entry.is_symlink():
+                files[entry.name] = _target_hash(os.readlink(entry.path))
+            elif entry.is_file():
+                files[entry.name] = None
+    return files
+
+
+def _on_files_changed(message: str) -> None:
+    # "+<хеш>:<имя>" - файл загружен, "-:<имя>" - файл удален
+    head, _, name = message.partition(":")
+    if head.startswith("+"):
+        _files[name] = head[1:] or None
+    else:
+        _files.pop(name, None)
+
+
+async def _files_changed(message: str) -> None:
+    _on_files_changed(message)
+    if _broker is not None:
+        await _broker.publish(FILES_CHANNEL, message)
+
+
+async def start(broker: Broker) -> None:
+    """
+    Построение индекса папки изображений и подписка на его изменения в других воркерах
+    :param broker: брокер шины уведомлений
+    """
+    global _broker
+    await _rescan()
+
+    _broker = broker
+    await broker.subscribe(FILES_CHANNEL, _on_files_changed)
+    broker.on_reconnect(_rescan)
+
+
+async def _rescan() -> None:
+    # При старте и после обрыва шины, когда изменения из других воркеров могли быть пропущены
+    files = await run_in_threadpool(_scan)
+    _files.clear()
+    _files.update(files)
+
+
+def contains(name: str) -> bool:
+    """
+    Проверка наличия имени в индексе, без обращения к файловой системе
+    :param name: имя файла в public/img
+    :return: True, если файл есть в индексе
+    """
+    return name in _files
+
+
+async def find(name: str) -> tuple[bool, Optional[str]]:
+    """
+    Поиск файла по имени. Обычно ответ берется из индекса; к файловой системе запрос идет только
+    при промахе (файл положили в папку вручную), найденный файл добавляется в индекс
+    :param name: имя файла в public/img
+    :return: существует ли файл и SHA-256 содержимого (None, если файл не загружен через API)
+    """
+    hash = _files.get(name, _MISSING)
+    if hash is not _MISSING:
+        return True, hash
+
+    exists, hash = await run_in_threadpool(_probe, name)
+    if exists:
+        _files[name] = hash
+    return exists, hash
+
+
+def _link(hash: str, name: str) -> None:
+    # Ссылка создается до переноса содержимого: symlink атомарно занимает имя и не перезаписывает существующий файл
+    os.symlink(os.path.join(BLOBS_DIR_NAME, hash[:2], hash), os.path.join(config.IMAGES_DIR, name))
+
+
+def _publish(tmp_path: str, hash: str) -> None:
+    path = blob_path(hash)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    # Одинаковое содержимое можно безопасно перезаписать
+    os.replace(tmp_path, path)
+
+
+def _remove_file(path: str) -> None:
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+async def store(chunks: AsyncIterator[bytes], name: str, db: AsyncSession) -> str:
+    """
+    Сохранение загружаемого файла под именем name.
+    Содержимое пишется по мере поступления блоками до IMAGE_UPLOAD_CHUNK_SIZE в пуле потоков,
+    хеш считается во время записи, размер ограничивается IMAGE_MAX_SIZE
+    :param chunks: блоки содержимого файла
+    :param name: имя файла в public/img
+    :param db: бд, сессия
+    :return: SHA-256 содержимого
+    """
+    # Занятое имя отклоняется до чтения тела запроса
+    if contains(name):
+        raise HTTPException(status_code=400, detail=f"File already exists")
+
+    # Временный файл на той же файловой системе, что и содержимое, чтобы перенос был атомарным
+    try:
+        fd, tmp_path = await run_in_threadpool(
+            tempfile.mkstemp, dir=os.path.join(config.IMAGES_DIR, BLOBS_DIR_NAME), prefix=".upload-"
+        )
+    except FileNotFoundError:
+        raise HTTPException(status_code=400, detail=f"Path not exists")
+    try:
+        size = 0
+        digest = hashlib.sha256()
+        pending: list[bytes] = []
+        pending_size = 0
+        with os.fdopen(fd, "wb") as buffer:
+            async for chunk in chunks:
+                size += len(chunk)
+                if size > config.IMAGE_MAX_SIZE:
+                    raise HTTPException(status_code=413, detail=f"File is larger than {config.IMAGE_MAX_SIZE} bytes")
+                digest.update(chunk)
+                pending.append(chunk)
+                pending_size += len(chunk)
+                # Мелкие блоки сервера собираются в одну запись, чтобы не переключаться в пул потоков на каждый
+                if pending_size >= config.IMAGE_UPLOAD_CHUNK_SIZE:
+                    await run_in_threadpool(buffer.write, b"".join(pending))
+                    pending.clear()
+                    pending_size = 0
+            if pending:
+                await run_in_threadpool(buffer.write, b"".join(pending))
+        hash = digest.hexdigest()
+
+        try:
+            await run_in_threadpool(_link, hash, name)
+        except FileExistsError:
+            raise HTTPException(status_code=400, detail=f"File already exists")
+
+        try:
+            await run_in_threadpool(_publish, tmp_path, hash)
+            await _files_changed(f"+{hash}:{name}")
+            await _add_reference(hash, size, db)
+        except BaseException:
+            # Без содержимого или строки в blobs ссылка не должна занимать имя: имя освобождается.
+            # Опубликованное содержимое остается, его может использовать другое имя
+            await db.rollback()
+            await run_in_threadpool(_remove_file, os.path.join(config.IMAGES_DIR, name))
+            await _files_changed(f"-:{name}")
+            raise
+    finally:
+        await run_in_threadpool(_remove_file, tmp_path)
+    return hash
+
+
+async def _add_reference(hash: str, size: int, db: AsyncSession) -> None:
+    result = await db.execute(update(Blob).where(Blob.hash == hash).values(ref_count=Blob.ref_count + 1))
+    if result.rowcount == 0:
+        try:
+            db.add(Blob(hash=hash, size=size, ref_count=1))
+            await db.commit()
+            return
+        except IntegrityError:
+            # Строку одновременно вставил другой запрос с тем же содержимым
+            await db.rollback()
+            await db.execute(update(Blob).where(Blob.hash == hash).values(ref_count=Blob.ref_count + 1))
+    await db.commit()
+
+
+async def release(names: Iterable[tuple[str, Optional[str]]], db: AsyncSession) -> None:
+    """
+    Удаление имен файлов и уменьшение счетчиков ссылок; содержимое без ссылок удаляется.
+    Файлы, положенные в папку вручную (без содержимого в blobs), не трогаются
+    :param names: пары (имя файла, SHA-256 содержимого)
+    :param db: бд, сессия
+    """
+    hashes = {}
+    for name, hash in names:
+        if hash:
+            await run_in_threadpool(_remove_file, os.path.join(config.IMAGES_DIR, name))
+            await _files_changed(f"-:{name}")
+            hashes[hash] = hashes.get(hash, 0) + 1
+
+    unused = []
+    for hash, count in hashes.items():
+        ref_count = await db.scalar(
+            update(Blob).where(Blob.hash == hash).values(ref_count=Blob.ref_count - count).returning(Blob.ref_count)
+        )
+        if ref_count is not None and ref_count <= 0:
+            unused.append(hash)
+
+    if unused:
+        # Содержимое, на которое за это время сослалась новая загрузка, не удаляется
+        unused = (await db.scalars(
+            delete(Blob).where(Blob.hash.in_(unused), Blob.ref_count <= 0).returning(Blob.hash)
+        )).all()
+    await db.commit()
+
+    for hash in unused:
+        await run_in_threadpool(_remove_file, blob_path(hash))
+
+
+async def release_files(names: Iterable[tuple[str, Optional[str]]]) -> None:
+    """
+    Освобождение файлов удаленных изображений в фоновой задаче (после отправки ответа), в собственной сессии.
+    Если задача не выполнится, содержимое останется на диске с завышенным счетчиком ссылок, но не потеряется
+    :param names: пары (имя файла, SHA-256 содержимого)
+    """
+    async with async_session_maker() as db:
+        await release(names, db)
@@ -0,0 +1,196 @@
+import asyncio
+import hashlib
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Optional
+
+from fastapi import HTTPException
+from PIL import Image as PILImage
+from starlette.concurrency import run_in_threadpool
+
+from backend import config
+
+"""
+Уменьшенные и перекодированные копии изображений товаров.
+Копии строятся в пуле процессов и хранятся в кэше на диске под именем-хешем от исходного файла и
+параметров; при превышении IMAGE_CACHE_MAX_SIZE удаляются давно не запрошенные копии (LRU).
+Кэш общий для всех воркеров, поэтому время последнего обращения хранится во времени изменения файла,
+а размер кэша считается по содержимому папки. Папка обходится не при каждом построении, а когда оценка
+размера (размер при последнем обходе плюс построенные с тех пор копии) превышает предел; копии
+вытесняются пачкой до EVICT_TARGET предела, чтобы следующий обход понадобился не сразу.
+"""
+
+# Поддерживаемые форматы: параметр fmt -> формат Pillow
+FORMATS = {"webp": "WEBP", "jpeg": "JPEG", "png": "PNG"}
+
+# Качество сжатия для webp/jpeg
+QUALITY = 80
+
+_executor: Optional[ProcessPoolExecutor] = None
+
+# Копии, запрошенные за последние EVICT_GRACE секунд, не вытесняются: их может отдавать другой воркер
+EVICT_GRACE = 60
+
+# Доля IMAGE_CACHE_MAX_SIZE, до которой кэш освобождается при вытеснении
+EVICT_TARGET = 0.9
+
+# Вытеснение в воркере выполняется по одному, повторный обход папки в это время не нужен
+_evicting = asyncio.Lock()
+
+# Оценка размера кэша: размер при последнем обходе папки плюс копии, построенные воркером с тех пор
+_cache_size: Optional[int] = None
+
+# Выполняющиеся построения, чтобы одновременные запросы одной копии не строили ее дважды
+_pending: dict[str, asyncio.Future] = {}
+
+
+class _InvalidSource(Exception):
+    """
+    Исходный файл не читается как изображение: нет файла, неизвестный формат, обрезанный файл
+    или слишком большое изображение (DecompressionBombError)
+    """
+
+
+def _render(source_path: str, target_path: str, width: int, fmt: str) -> int:
+    """
+    Уменьшение изображения до ширины width (без увеличения) и сохранение в формате fmt.
+    Выполняется в отдельном процессе
+    :return: размер полученного файла
+    """
+    # Ошибки чтения исходного файла - ошибки клиентских данных, ошибки записи копии - ошибки сервера
+    try:
+        source = PILImage.open(source_path)
+    except (OSError, PILImage.DecompressionBombError) as e:
+        raise _InvalidSource(str(e)) from None
+
+    with source as image:
+        try:
+            image.thumbnail((width, image.height))
+            if fmt == "jpeg" and image.mode not in ("RGB", "L"):
+                image = image.convert("RGB")
+        except (OSError, PILImage.DecompressionBombError) as e:
+            raise _InvalidSource(str(e)) from None
+
+        os.makedirs(os.path.dirname(target_path), exist_ok=True)
+        tmp_path = f"{target_path}.{os.getpid()}.tmp"
+        image.save(tmp_path, format=FORMATS[fmt], quality=QUALITY)
+        os.replace(tmp_path, target_path)
+
+    return os.path.getsize(target_path)
+
+
+def _cache_path(key: str, fmt: str) -> str:
+    return os.path.join(config.IMAGE_CACHE_DIR, key[:2], f"{key}.{fmt}")
+
+
+def _scan_cache() -> list[tuple[float, str, int]]:
+    files = []
+    for root, _, names in os.walk(config.IMAGE_CACHE_DIR):
+        for name in names:
+            key, ext = os.path.splitext(name)
+            if ext[1:] in FORMATS:
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                files.append((stat.st_mtime, path, stat.st_size))
+    return sorted(files)
+
+
+def _evict(keep: str) -> int:
+    # Размер считается по папке, а не по учету воркера: в кэш пишут все воркеры.
+    # Только что построенная копия keep не вытесняется: ее сейчас отдают клиенту.
+    # Возвращает размер кэша после вытеснения
+    files = _scan_cache()
+    total_size = sum(size for _, _, size in files)
+    target = config.IMAGE_CACHE_MAX_SIZE * EVICT_TARGET
+    deadline = time.time() - EVICT_GRACE
+    for mtime, path, size in files:
+        if total_size <= target or mtime > deadline:
+            break
+        if path == keep:
+            continue
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        total_size -= size
+    return total_size
+
+
+def _touch(path: str) -> Optional[os.stat_result]:
+    # Обращение к копии продлевает ее жизнь в кэше; None, если копию уже вытеснили
+    try:
+        os.utime(path)
+        return os.stat(path)
+    except FileNotFoundError:
+        return None
+
+
+async def start() -> None:
+    """
+    Запуск пула процессов при старте воркера
+    """
+    global _executor
+    _executor = ProcessPoolExecutor(max_workers=config.IMAGE_RENDER_WORKERS)
+
+
+async def stop() -> None:
+    """
+    Остановка пула процессов при завершении воркера
+    """
+    if _executor is not None:
+        _executor.shutdown(cancel_futures=True)
+
+
+async def _build(source_path: str, path: str, width: int, fmt: str) -> None:
+    global _cache_size
+    name = os.path.basename(path)
+    future = _pending.get(name)
+    owner = future is None
+    if owner:
+        loop = asyncio.get_running_loop()
+        _pending[name] = future = loop.run_in_executor(_executor, _render, source_path, path, width, fmt)
+
+    try:
+        size = await asyncio.shield(future)
+    except _InvalidSource:
+        raise HTTPException(status_code=400, detail=f"File can not be rendered")
+    finally:
+        if owner:
+            _pending.pop(name, None)
+
+    if not owner:
+        return
+    if _cache_size is not None:
+        _cache_size += size
+    if (_cache_size is None or _cache_size > config.IMAGE_CACHE_MAX_SIZE) and not _evicting.locked():
+        async with _evicting:
+            # Недавно запрошенные копии не вытесняются, поэтому размер может остаться выше цели;
+            # оценка все равно ограничивается целью, чтобы следующий обход был не раньше следующей пачки копий
+            _cache_size = min(await run_in_threadpool(_evict, path), int(config.IMAGE_CACHE_MAX_SIZE * EVICT_TARGET))
+
+
+async def render(source_path: str, source_key: str, width: int, fmt: str) -> tuple[str, os.stat_result]:
+    """
+    Получение пути к копии изображения нужной ширины и формата, при отсутствии в кэше копия строится
+    :param source_path: путь к исходному файлу
+    :param source_key: идентификатор содержимого исходного файла (меняется при изменении файла)
+    :param width: ширина копии
+    :param fmt: формат копии (webp, jpeg, png)
+    :return: путь к файлу копии и его stat для отправки
+    """
+    key = hashlib.sha256(f"{source_key}:{width}:{fmt}:{QUALITY}".encode()).hexdigest()
+    path = _cache_path(key, fmt)
+
+    stat = await run_in_threadpool(_touch, path)
+    # Копию мог вытеснить другой воркер между построением и отправкой, тогда она строится заново
+    for _ in range(3):
+        if stat is not None:
+            return path, stat
+        await _build(source_path, path, width, fmt)
+        stat = await run_in_threadpool(_touch, path)
+
+    raise HTTPException(status_code=503, detail=f"Image cache is full")
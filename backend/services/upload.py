@@ -0,0 +1,136 @@
+from typing import AsyncIterator, Optional
+
+from fastapi import HTTPException, Request
+from python_multipart.exceptions import MultipartParseError
+from python_multipart.multipart import MultipartParser, parse_options_header
+
+"""
+Потоковое чтение загружаемого файла из тела multipart/form-data.
+Тело читается из request.stream() по мере поступления, содержимое файла отдается блоками без буферизации
+всего тела в памяти или на диске; размер тела ограничивается до чтения (Content-Length) и во время чтения.
+"""
+
+# Запас на границы, заголовки частей и прочие поля формы сверх размера файла
+MULTIPART_OVERHEAD = 64 * 1024
+
+
+class _FilePart:
+    """
+    Обработчики парсера multipart: имя и содержимое первой части поля field с именем файла
+    """
+
+    def __init__(self, field: str):
+        self.field = field
+        self.filename: Optional[str] = None
+        self.finished = False
+        self._chunks: list[bytes] = []
+        self._reading = False
+        self._header_name = b""
+        self._header_value = b""
+        self._disposition = b""
+
+    def callbacks(self) -> dict:
+        return {
+            "on_part_begin": self._on_part_begin,
+            "on_header_field": self._on_header_field,
+            "on_header_value": self._on_header_value,
+            "on_header_end": self._on_header_end,
+            "on_headers_finished": self._on_headers_finished,
+            "on_part_data": self._on_part_data,
+            "on_part_end": self._on_part_end,
+        }
+
+    def take(self) -> bytes:
+        # Содержимое файла, разобранное с прошлого вызова
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+    def _on_part_begin(self) -> None:
+        self._disposition = b""
+
+    def _on_header_field(self, data: bytes, start: int, end: int) -> None:
+        self._header_name += data[start:end]
+
+    def _on_header_value(self, data: bytes, start: int, end: int) -> None:
+        self._header_value += data[start:end]
+
+    def _on_header_end(self) -> None:
+        if self._header_name.lower() == b"content-disposition":
+            self._disposition = self._header_value
+        self._header_name, self._header_value = b"", b""
+
+    def _on_headers_finished(self) -> None:
+        _, options = parse_options_header(self._disposition)
+        if self.filename is None and options.get(b"name") == self.field.encode() and b"filename" in options:
+            self.filename = options[b"filename"].decode(errors="replace")
+            self._reading = True
+
+    def _on_part_data(self, data: bytes, start: int, end: int) -> None:
+        if self._reading:
+            self._chunks.append(data[start:end])
+
+    def _on_part_end(self) -> None:
+        if self._reading:
+            self._reading = False
+            self.finished = True
+
+
+async def _limited(request: Request, limit: int) -> AsyncIterator[bytes]:
+    received = 0
+    async for chunk in request.stream():
+        received += len(chunk)
+        if received > limit:
+            raise HTTPException(status_code=413, detail=f"Request body is larger than {limit} bytes")
+        yield chunk
+
+
+async def open_file(request: Request, max_size: int, field: str = "file") -> tuple[str, AsyncIterator[bytes]]:
+    """
+    Начало чтения файла из multipart тела запроса.
+    Тело читается только до заголовков части с файлом, остальное - по мере чтения содержимого
+    :param request: запрос
+    :param max_size: максимальный размер файла в байтах (тело ограничивается max_size + MULTIPART_OVERHEAD)
+    :param field: имя поля формы с файлом
+    :return: имя файла, присланное клиентом, и блоки содержимого файла
+    """
+    limit = max_size + MULTIPART_OVERHEAD
+    # Заведомо большой запрос отклоняется до чтения тела
+    length = request.headers.get("content-length", "")
+    if length.isdigit() and int(length) > limit:
+        raise HTTPException(status_code=413, detail=f"File is larger than {max_size} bytes")
+
+    content_type, params = parse_options_header(request.headers.get("content-type", ""))
+    if content_type != b"multipart/form-data" or b"boundary" not in params:
+        raise HTTPException(status_code=400, detail="Expected multipart/form-data")
+
+    part = _FilePart(field)
+    parser = MultipartParser(params[b"boundary"], part.callbacks())
+    body = _limited(request, limit)
+
+    def write(chunk: bytes) -> None:
+        try:
+            parser.write(chunk)
+        except MultipartParseError:
+            raise HTTPException(status_code=400, detail="Malformed multipart body")
+
+    async for chunk in body:
+        write(chunk)
+        if part.filename is not None:
+            break
+    if part.filename is None:
+        raise HTTPException(status_code=400, detail=f"Field {field} with a file is missing")
+
+    async def content() -> AsyncIterator[bytes]:
+        if data := part.take():
+            yield data
+        # Остаток тела после части с файлом не читается
+        while not part.finished:
+            chunk = await anext(body, None)
+            if chunk is None:
+                raise HTTPException(status_code=400, detail="Incomplete multipart body")
+            write(chunk)
+            if data := part.take():
+                yield data
+
+    return part.filename, content()
@@ -1,4 +1,6 @@
-from sqlalchemy.orm import Session
+from sqlalchemy import select, delete
+from sqlalchemy.ext.asyncio import AsyncSession
+from backend.auth.auth import revoke
 from backend.models.user import User
 from backend.dto.user import UserUpdate
 
@@ -11,23 +13,27 @@ from backend.dto.user import UserUpdate
 #     return user
 
 
-def get_user_by_id(id: int, db: Session) -> User | None:
+async def get_user_by_id(id: int, db: AsyncSession) -> User | None:
 
-    return db.query(User).filter(User.id == id).first()
+    return await db.scalar(select(User).where(User.id == id))
 
 
-def update_user(id: int, data: UserUpdate, db: Session) -> User | None:
-    user = get_user_by_id(id, db)
+async def update_user(id: int, data: UserUpdate, db: AsyncSession) -> User | None:
+    user = await get_user_by_id(id, db)
     if user:
         for field, value in data.dict(exclude_unset=True).items():
             setattr(user, field, value)
-        db.commit()
-        db.refresh(user)
+        await db.commit()
+        await db.refresh(user)
+        # Роль и имя хранятся в выданных токенах, поэтому после изменения пользователь входит заново
+        await revoke(id, db)
         return user
     return None
 
 
-def delete_user(id: int, db: Session) -> int:
-    user = db.query(User).filter(User.id == id).delete()
-    db.commit()
-    return user
+async def delete_user(id: int, db: AsyncSession) -> int:
+    result = await db.execute(delete(User).where(User.id == id))
+    await db.commit()
+    if result.rowcount:
+        await revoke(id, db)
+    return result.rowcount
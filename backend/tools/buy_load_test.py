@@ -0,0 +1,114 @@
+import argparse
+import asyncio
+import statistics
+import sys
+import time
+
+from fastapi import HTTPException
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+from backend import config
+from backend.database import create_engine
+from backend.dto import product as ProductDTO, category as CategoryDTO, brand as BrandDTO
+from backend.models import blob, catalog_counter, image  # noqa: F401 - регистрация таблиц в Base.metadata
+from backend.models.product import Product
+from backend.services import product as ProductService, category as CategoryService, brand as BrandService
+
+"""
+Нагрузочный тест покупки одного товара (PUT /product/buy/{id}): много одновременных покупателей
+уменьшают остаток одного SKU через ProductService.buy_product, каждый в своей сессии, как отдельные запросы.
+Проверяется, что товар не продан сверх остатка: число успешных покупок равно проданному количеству,
+остаток не уходит в минус, остальные покупки получают 409. Выводятся пропускная способность и задержки.
+Бд берется из DATABASE_URL (или --url) и должна быть создана миграциями; тест создает свои категорию, бренд
+и товар и удаляет их после проверки. Конкурентность имеет смысл проверять на PostgreSQL: SQLite выполняет
+записи по одной.
+Запуск: python -m backend.tools.buy_load_test --buyers 50 --stock 1000
+Код возврата 1, если проверка не прошла.
+"""
+
+
+def _percentile(values: list[float], percent: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * percent / 100))]
+
+
+async def main(url: str, buyers: int, stock: int, count: int, attempts: int) -> bool:
+    engine = create_engine(url)
+    session_maker = async_sessionmaker(engine, autoflush=False, expire_on_commit=False)
+
+    async with session_maker() as db:
+        category = await CategoryService.create_category(CategoryDTO.Category(name="load test"), db)
+        brand = await BrandService.create_brand(BrandDTO.Brand(name="load test"), db)
+        product = await ProductService.create_product(ProductDTO.Product(
+            title="load test", description="load test", count=stock, category_id=category.id, brand_id=brand.id,
+            price=1.0,
+        ), db)
+
+    results = {"ok": 0, 409: 0}
+    errors: list[str] = []
+    latencies: list[float] = []
+    remaining = attempts
+
+    async def buyer() -> None:
+        nonlocal remaining
+        while remaining > 0:
+            remaining -= 1
+            start = time.perf_counter()
+            try:
+                async with session_maker() as db:
+                    await ProductService.buy_product(product.id, ProductDTO.ProductBuy(count=count), db)
+                results["ok"] += 1
+            except HTTPException as e:
+                if e.status_code == 409:
+                    results[409] += 1
+                else:
+                    errors.append(f"{e.status_code} {e.detail}")
+            except Exception as e:
+                errors.append(repr(e))
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    try:
+        await asyncio.gather(*(buyer() for _ in range(buyers)))
+        elapsed = time.perf_counter() - start
+
+        async with session_maker() as db:
+            left = await db.scalar(select(Product.count).where(Product.id == product.id))
+    finally:
+        async with session_maker() as db:
+            await ProductService.remove(product.id, db)
+            await BrandService.remove(brand.id, db)
+            await CategoryService.remove(category.id, db)
+        await engine.dispose()
+
+    sold = results["ok"] * count
+    print(f"{engine.dialect.name}: {buyers} buyers, {attempts} purchases of {count} from stock {stock}")
+    print(f"  succeeded {results['ok']}, 409 {results[409]}, other errors {len(errors)}, left in stock {left}")
+    print(f"  {attempts / elapsed:.0f} purchases/s, latency p50 {_percentile(latencies, 50) * 1000:.1f} ms, "
+          f"p95 {_percentile(latencies, 95) * 1000:.1f} ms, p99 {_percentile(latencies, 99) * 1000:.1f} ms, "
+          f"mean {statistics.mean(latencies) * 1000:.1f} ms")
+
+    problems = []
+    if left < 0:
+        problems.append(f"stock went negative: {left}")
+    if sold != stock - left:
+        problems.append(f"sold {sold}, but stock decreased by {stock - left}")
+    if attempts * count >= stock and left >= count:
+        problems.append(f"{left} left in stock although buyers were refused")
+    problems.extend(errors[:10])
+    for problem in problems:
+        print(f"  FAIL: {problem}")
+    return not problems
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Нагрузочный тест покупки одного товара")
+    parser.add_argument("--url", default=config.DATABASE_URL, help="подключение к бд")
+    parser.add_argument("--buyers", type=int, default=50, help="одновременных покупателей")
+    parser.add_argument("--stock", type=int, default=1000, help="начальный остаток товара")
+    parser.add_argument("--count", type=int, default=1, help="количество в одной покупке")
+    parser.add_argument("--attempts", type=int, help="всего покупок (по умолчанию вдвое больше остатка)")
+    args = parser.parse_args()
+    attempts = args.attempts or 2 * args.stock // args.count
+    sys.exit(0 if asyncio.run(main(args.url, args.buyers, args.stock, args.count, attempts)) else 1)
@@ -0,0 +1,113 @@
+import argparse
+import asyncio
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncConnection
+
+from backend.database import engine as Engine
+
+"""
+Отчет по индексам бд (PostgreSQL): самые затратные запросы из pg_stat_statements, таблицы, которые читаются
+последовательным сканированием, неиспользуемые индексы и внешние ключи без индекса.
+Запуск после нагрузки на тестовую бд: python -m backend.tools.index_advisor
+Статистика копится с последнего pg_stat_reset() / pg_stat_statements_reset()
+"""
+
+TOP_STATEMENTS = text("""
+    SELECT calls, total_exec_time, mean_exec_time, rows, query
+    FROM pg_stat_statements
+    WHERE dbid = (SELECT oid FROM pg_database WHERE datname = current_database())
+    ORDER BY total_exec_time DESC
+    LIMIT :limit
+""")
+
+SEQUENTIAL_SCANS = text("""
+    SELECT relname, seq_scan, seq_tup_read, coalesce(idx_scan, 0) AS idx_scan, n_live_tup
+    FROM pg_stat_user_tables
+    WHERE seq_scan > 0
+    ORDER BY seq_tup_read DESC
+""")
+
+UNUSED_INDEXES = text("""
+    SELECT s.relname, s.indexrelname, pg_relation_size(s.indexrelid) AS size
+    FROM pg_stat_user_indexes s
+    JOIN pg_index i ON i.indexrelid = s.indexrelid
+    WHERE s.idx_scan = 0 AND NOT i.indisunique AND NOT i.indisprimary
+    ORDER BY size DESC
+""")
+
+# Внешний ключ покрыт индексом, если его колонки - начало ключа индекса
+UNINDEXED_FOREIGN_KEYS = text("""
+    SELECT c.conrelid::regclass::text AS relname, c.conname,
+           array_to_string(ARRAY(SELECT a.attname FROM unnest(c.conkey) WITH ORDINALITY k(attnum, n)
+                                 JOIN pg_attribute a ON a.attrelid = c.conrelid AND a.attnum = k.attnum
+                                 ORDER BY k.n), ', ') AS columns
+    FROM pg_constraint c
+    JOIN pg_namespace ns ON ns.oid = c.connamespace
+    WHERE c.contype = 'f' AND ns.nspname = current_schema()
+      AND NOT EXISTS (
+          SELECT 1 FROM pg_index i
+          WHERE i.indrelid = c.conrelid
+            AND (i.indkey::int2[])[0:array_length(c.conkey, 1) - 1] @> c.conkey
+            AND (i.indkey::int2[])[0:array_length(c.conkey, 1) - 1] <@ c.conkey
+      )
+    ORDER BY relname, c.conname
+""")
+
+
+async def _has_pg_stat_statements(conn: AsyncConnection) -> bool:
+    result = await conn.execute(text("SELECT 1 FROM pg_extension WHERE extname = 'pg_stat_statements'"))
+    return result.scalar() is not None
+
+
+async def report(conn: AsyncConnection, limit: int = 10) -> list[str]:
+    """
+    Отчет по индексам текущей бд
+    :param conn: соединение с бд
+    :param limit: количество запросов из pg_stat_statements
+    :return: строки отчета
+    """
+    lines = []
+
+    lines.append(f"Top {limit} statements by total time:")
+    if await _has_pg_stat_statements(conn):
+        for row in await conn.execute(TOP_STATEMENTS, {"limit": limit}):
+            query = " ".join(row.query.split())
+            lines.append(f"  {row.total_exec_time:10.1f} ms total {row.mean_exec_time:8.2f} ms mean "
+                         f"{row.calls:8d} calls {row.rows:8d} rows  {query}")
+    else:
+        lines.append("  pg_stat_statements is not installed: add it to shared_preload_libraries and run "
+                     "CREATE EXTENSION pg_stat_statements")
+
+    lines.append("")
+    lines.append("Sequential scans (tables read without an index):")
+    for row in await conn.execute(SEQUENTIAL_SCANS):
+        hint = "  <- check filters on this table" if row.seq_scan > row.idx_scan and row.n_live_tup > 1000 else ""
+        lines.append(f"  {row.relname}: {row.seq_scan} seq scans read {row.seq_tup_read} rows, "
+                     f"{row.idx_scan} index scans, {row.n_live_tup} rows{hint}")
+
+    lines.append("")
+    lines.append("Unused indexes (no scans, not unique):")
+    for row in await conn.execute(UNUSED_INDEXES):
+        lines.append(f"  {row.relname}.{row.indexrelname}: {row.size} bytes")
+
+    lines.append("")
+    lines.append("Foreign keys without an index:")
+    for row in await conn.execute(UNINDEXED_FOREIGN_KEYS):
+        lines.append(f"  {row.relname}.{row.conname} ({row.columns})")
+
+    return lines
+
+
+async def main(limit: int) -> None:
+    async with Engine.connect() as conn:
+        if conn.dialect.name != "postgresql":
+            raise SystemExit("Index advisor requires PostgreSQL")
+        print("\n".join(await report(conn, limit)))
+    await Engine.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Отчет по индексам бд")
+    parser.add_argument("--limit", type=int, default=10, help="количество запросов из pg_stat_statements")
+    asyncio.run(main(parser.parse_args().limit))
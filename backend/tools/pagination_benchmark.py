@@ -0,0 +1,139 @@
+import argparse
+import asyncio
+import time
+
+from sqlalchemy import event, select, insert, func
+from sqlalchemy.ext.asyncio import AsyncEngine, create_async_engine, async_sessionmaker
+from sqlalchemy.orm import joinedload
+from sqlalchemy.pool import StaticPool
+
+from backend.database import Base
+from backend.models import blob  # noqa: F401 - регистрация таблиц в Base.metadata
+from backend.models.brand import Brand
+from backend.models.catalog_counter import CatalogCounter
+from backend.models.category import Category
+from backend.models.image import Image
+from backend.models.product import Product
+from backend.services import product as ProductService
+
+"""
+Бенчмарк страницы списка товаров (GET /product/?skip=&limit=) для товаров с 0, 5 и 50 изображениями.
+Сравниваются прежний путь (joinedload(Product.images) вместе с OFFSET/LIMIT и количество по подзапросу
+с тем же join) и текущий (страница по строкам products без join, изображения страницы одним запросом
+WHERE product_id IN (...), количество по счетчикам каталога).
+Для каждого варианта выводятся число запросов, число строк и значений (строки x колонки), переданных бд
+(запросы варианта повторяются и их результаты считаются), лучшее время из --repeat повторов и общее
+количество товаров, которое получает клиент.
+Бд - SQLite в памяти, поэтому абсолютные числа меньше, чем с PostgreSQL; важно соотношение.
+Запуск: python -m backend.tools.pagination_benchmark
+"""
+
+
+class _Statements:
+    """
+    Запись SQL запросов, выполненных движком
+    """
+
+    def __init__(self, engine: AsyncEngine):
+        self.engine = engine
+        self.items: list[tuple[str, object]] = []
+
+    def _record(self, conn, cursor, statement, parameters, context, executemany) -> None:
+        self.items.append((statement, parameters))
+
+    def __enter__(self) -> "_Statements":
+        event.listen(self.engine.sync_engine, "before_cursor_execute", self._record)
+        return self
+
+    def __exit__(self, *exc) -> None:
+        event.remove(self.engine.sync_engine, "before_cursor_execute", self._record)
+
+
+async def _transferred(engine: AsyncEngine, statements: _Statements) -> tuple[int, int]:
+    # Повтор записанных запросов: сколько строк и значений (строки x колонки) они вернули клиенту
+    rows, values = 0, 0
+    async with engine.connect() as conn:
+        for statement, parameters in statements.items:
+            result = (await conn.exec_driver_sql(statement, parameters)).all()
+            rows += len(result)
+            values += sum(len(row) for row in result)
+    return rows, values
+
+
+async def _best_async(function, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        await function()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+async def page(products: int, images: int, limit: int, skip: int, repeat: int) -> dict[str, tuple]:
+    """
+    Запросы, строки и время чтения одной страницы товаров
+    :param products: количество товаров в бд
+    :param images: изображений у каждого товара
+    :param limit: размер страницы
+    :param skip: смещение страницы
+    :param repeat: количество повторов (берется лучшее время)
+    :return: вариант -> (запросов, строк, значений, общее количество товаров в ответе, время в секундах)
+    """
+    engine = create_async_engine("sqlite+aiosqlite://", poolclass=StaticPool)
+    session_maker = async_sessionmaker(engine, expire_on_commit=False)
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+        await conn.execute(insert(Category), [{"id": 1, "name": "c"}])
+        await conn.execute(insert(Brand), [{"id": 1, "name": "b"}])
+        await conn.execute(insert(Product), [
+            {"id": id, "title": f"Товар {id}", "description": "Описание", "count": 1, "price": 1.0,
+             "category_id": 1, "brand_id": 1} for id in range(1, products + 1)
+        ])
+        if images:
+            await conn.execute(insert(Image), [
+                {"name": f"{id}_{n}.jpg", "product_id": id} for id in range(1, products + 1) for n in range(images)
+            ])
+        await conn.execute(insert(CatalogCounter), [{"category_id": 1, "brand_id": 1, "in_stock": True,
+                                                     "count": products}])
+
+    async def joined() -> int:
+        async with session_maker() as db:
+            query = select(Product).options(joinedload(Product.images))
+            result = await db.execute(query.order_by(Product.id).offset(skip).limit(limit))
+            result.unique().scalars().all()
+            return await db.scalar(select(func.count()).select_from(query.subquery()))
+
+    async def batched() -> int:
+        async with session_maker() as db:
+            _, total = await ProductService.get_products(db, skip, limit)
+            return total
+
+    try:
+        results = {}
+        for name, function in (("joinedload + LIMIT", joined), ("page + IN (...)", batched)):
+            with _Statements(engine) as statements:
+                total = await function()
+            results[name] = (len(statements.items), *await _transferred(engine, statements), total,
+                             await _best_async(function, repeat))
+        return results
+    finally:
+        await engine.dispose()
+
+
+async def main(products: int, images: list[int], limit: int, skip: int, repeat: int) -> None:
+    for count in images:
+        print(f"{products} products with {count} images, page of {limit} at offset {skip}:")
+        for name, (queries, rows, values, total, seconds) in (await page(products, count, limit, skip, repeat)).items():
+            print(f"  {name:<20} {queries} queries {rows:6d} rows {values:7d} values {seconds * 1000:9.3f} ms"
+                  f"   total {total}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Бенчмарк пагинации товаров с изображениями")
+    parser.add_argument("--products", type=int, default=1000, help="количество товаров")
+    parser.add_argument("--images", type=int, nargs="+", default=[0, 5, 50], help="изображений у товара")
+    parser.add_argument("--limit", type=int, default=20, help="размер страницы")
+    parser.add_argument("--skip", type=int, default=100, help="смещение страницы")
+    parser.add_argument("--repeat", type=int, default=20, help="количество повторов")
+    args = parser.parse_args()
+    asyncio.run(main(args.products, args.images, args.limit, args.skip, args.repeat))
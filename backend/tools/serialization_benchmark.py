@@ -0,0 +1,152 @@
+import argparse
+import asyncio
+import json
+import time
+from datetime import datetime, timezone
+from typing import Callable, List
+
+from fastapi.encoders import jsonable_encoder
+from pydantic import TypeAdapter
+from sqlalchemy import select, insert
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+from sqlalchemy.orm import selectinload
+from sqlalchemy.orm.attributes import set_committed_value
+from sqlalchemy.pool import StaticPool
+
+from backend.database import Base
+from backend.dto import product as ProductDTO, image as ImageDTO
+from backend.models import blob, catalog_counter  # noqa: F401 - регистрация таблиц в Base.metadata
+from backend.models.brand import Brand
+from backend.models.category import Category
+from backend.models.image import Image
+from backend.models.product import Product
+from backend.services import product as ProductService
+
+"""
+Микро-бенчмарк списка товаров: чтение страницы из бд и сериализация ответа для 10/100/1000 товаров
+(по 2 изображения у каждого). Сравниваются прежний путь (объекты ORM + jsonable_encoder + json.dumps)
+и текущий (выборка колонок в DTO + сериализация response_model в pydantic-core).
+Бд - SQLite в памяти, поэтому абсолютные числа меньше, чем с PostgreSQL; важно соотношение.
+Запуск: python -m backend.tools.serialization_benchmark
+"""
+
+IMAGES_PER_PRODUCT = 2
+
+PAGE = TypeAdapter(List[ProductDTO.ProductRead])
+
+
+def _best(function: Callable[[], object], repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+async def _best_async(function, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        await function()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def _orm_products(size: int) -> list[Product]:
+    now = datetime.now(timezone.utc)
+    products = []
+    for id in range(1, size + 1):
+        product = Product(id=id, title=f"Товар {id}", description="Описание товара " * 4, count=id % 5,
+                          price=id * 1.5, category_id=1, brand_id=1, updated_at=now)
+        # Без событий обратной ссылки image.product: jsonable_encoder ушел бы в бесконечную рекурсию
+        set_committed_value(product, "images", [
+            Image(id=id * IMAGES_PER_PRODUCT + n, name=f"{id}_{n}.jpg", product_id=id, updated_at=now)
+            for n in range(IMAGES_PER_PRODUCT)
+        ])
+        products.append(product)
+    return products
+
+
+def _dto_products(products: list[Product]) -> list[ProductDTO.ProductRead]:
+    return [
+        ProductDTO.ProductRead.model_construct(
+            **{field: getattr(product, field) for field in ProductDTO.ProductRecord.model_fields},
+            images=[ImageDTO.ImageRead.model_construct(
+                **{field: getattr(image, field) for field in ImageDTO.ImageRead.model_fields}
+            ) for image in product.images],
+        )
+        for product in products
+    ]
+
+
+def serialization(size: int, repeat: int) -> dict[str, float]:
+    """
+    Время сериализации списка товаров
+    :param size: количество товаров
+    :param repeat: количество повторов (берется лучшее время)
+    :return: вариант -> время в секундах
+    """
+    products = _orm_products(size)
+    dtos = _dto_products(products)
+    return {
+        "orm + jsonable_encoder": _best(lambda: json.dumps(jsonable_encoder(products)).encode(), repeat),
+        "orm + response_model": _best(lambda: PAGE.dump_json(PAGE.validate_python(products, from_attributes=True)),
+                                      repeat),
+        "dto + response_model": _best(lambda: PAGE.dump_json(PAGE.validate_python(dtos)), repeat),
+    }
+
+
+async def loading(size: int, repeat: int) -> dict[str, float]:
+    """
+    Время чтения страницы товаров с изображениями из бд
+    :param size: количество товаров
+    :param repeat: количество повторов (берется лучшее время)
+    :return: вариант -> время в секундах
+    """
+    engine = create_async_engine("sqlite+aiosqlite://", poolclass=StaticPool)
+    session_maker = async_sessionmaker(engine, expire_on_commit=False)
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+        await conn.execute(insert(Category), [{"id": 1, "name": "c"}])
+        await conn.execute(insert(Brand), [{"id": 1, "name": "b"}])
+        await conn.execute(insert(Product), [
+            {"id": id, "title": f"Товар {id}", "description": "Описание", "count": 1, "price": 1.0,
+             "category_id": 1, "brand_id": 1} for id in range(1, size + 1)
+        ])
+        await conn.execute(insert(Image), [
+            {"name": f"{id}_{n}.jpg", "product_id": id} for id in range(1, size + 1) for n in range(IMAGES_PER_PRODUCT)
+        ])
+
+    async def orm():
+        async with session_maker() as db:
+            (await db.scalars(select(Product).order_by(Product.id).options(selectinload(Product.images)))).all()
+
+    async def columns():
+        async with session_maker() as db:
+            await ProductService.read_products(select(*ProductService.PRODUCT_COLUMNS).order_by(Product.id), db)
+
+    try:
+        return {
+            "orm + selectinload": await _best_async(orm, repeat),
+            "columns -> dto": await _best_async(columns, repeat),
+        }
+    finally:
+        await engine.dispose()
+
+
+async def main(sizes: list[int], repeat: int) -> None:
+    for size in sizes:
+        print(f"{size} products:")
+        for name, seconds in (await loading(size, repeat)).items():
+            print(f"  load      {name:<24} {seconds * 1000:9.3f} ms")
+        for name, seconds in serialization(size, repeat).items():
+            print(f"  serialize {name:<24} {seconds * 1000:9.3f} ms")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Бенчмарк чтения и сериализации списка товаров")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10, 100, 1000], help="размеры страниц")
+    parser.add_argument("--repeat", type=int, default=20, help="количество повторов")
+    args = parser.parse_args()
+    asyncio.run(main(args.sizes, args.repeat))
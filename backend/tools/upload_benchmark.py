@@ -0,0 +1,146 @@
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+import tracemalloc
+from typing import Iterator, Optional
+
+from fastapi import HTTPException
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+from sqlalchemy.pool import StaticPool
+from starlette.requests import Request
+
+from backend import config
+from backend.models import brand, category, catalog_counter, product  # noqa: F401 - настройка связей моделей
+from backend.models.blob import Blob
+from backend.services import image as ImageService, storage as StorageService
+
+"""
+Бенчмарк загрузки изображения (POST /image/upload/): время и пиковая память Python (tracemalloc) при загрузке
+файлов разного размера, по умолчанию 1 КБ и 200 МБ. Тело запроса подается блоками по 64 КБ, как его отдает
+uvicorn, и не хранится в памяти целиком; при потоковой загрузке пиковая память не зависит от размера файла
+и ограничена буфером записи на диск (IMAGE_UPLOAD_CHUNK_SIZE).
+Для файла больше IMAGE_MAX_SIZE показывается, сколько байт тела прочитано до ответа 413: с Content-Length - ноль,
+без него (chunked) - не больше IMAGE_MAX_SIZE с небольшим запасом; для сравнения приведен разбор формы
+request.form(), которым пользовался FastAPI (UploadFile), - он читает тело целиком.
+Запуск: python -m backend.tools.upload_benchmark
+"""
+
+BOUNDARY = "benchmark-boundary"
+
+# Размер блока тела запроса, который передает сервер
+BODY_CHUNK_SIZE = 64 * 1024
+
+MB = 1024 * 1024
+
+
+class _Body:
+    """
+    Тело multipart запроса с одним файлом, генерируемое блоками; считает прочитанные байты
+    """
+
+    def __init__(self, name: str, size: int):
+        self.head = (f'--{BOUNDARY}\r\nContent-Disposition: form-data; name="file"; filename="{name}"\r\n'
+                     f'Content-Type: image/jpeg\r\n\r\n').encode()
+        self.tail = f"\r\n--{BOUNDARY}--\r\n".encode()
+        self.size = size
+        self.length = len(self.head) + size + len(self.tail)
+        self.received = 0
+
+    def chunks(self) -> Iterator[bytes]:
+        yield self.head
+        block = b"\xff" * BODY_CHUNK_SIZE
+        left = self.size
+        while left > 0:
+            yield block[:min(left, BODY_CHUNK_SIZE)]
+            left -= BODY_CHUNK_SIZE
+        yield self.tail
+
+    def request(self, content_length: bool = True) -> Request:
+        chunks = self.chunks()
+
+        async def receive() -> dict:
+            chunk = next(chunks, None)
+            if chunk is None:
+                return {"type": "http.request", "body": b"", "more_body": False}
+            self.received += len(chunk)
+            return {"type": "http.request", "body": chunk, "more_body": True}
+
+        headers = [(b"content-type", f"multipart/form-data; boundary={BOUNDARY}".encode())]
+        if content_length:
+            headers.append((b"content-length", str(self.length).encode()))
+        return Request({"type": "http", "method": "POST", "path": "/image/upload/", "headers": headers}, receive)
+
+
+async def _upload(session_maker, body: _Body, content_length: bool = True) -> Optional[int]:
+    # Код ошибки или None при успешной загрузке
+    async with session_maker() as db:
+        try:
+            await ImageService.upload_image(body.request(content_length), db)
+        except HTTPException as e:
+            return e.status_code
+    return None
+
+
+async def _form(body: _Body) -> None:
+    # Прежний путь: FastAPI разбирает форму целиком до вызова обработчика
+    form = await body.request().form()
+    await form.close()
+
+
+async def _measure(coroutine) -> tuple[object, float, int]:
+    # Результат, время и пиковая память Python за время выполнения
+    tracemalloc.start()
+    start = time.perf_counter()
+    try:
+        result = await coroutine
+        elapsed = time.perf_counter() - start
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return result, elapsed, peak
+
+
+async def main(sizes: list[int], limit: int) -> None:
+    engine = create_async_engine("sqlite+aiosqlite://", poolclass=StaticPool)
+    session_maker = async_sessionmaker(engine, expire_on_commit=False)
+    async with engine.begin() as conn:
+        # Загрузке нужна только таблица счетчиков ссылок на содержимое
+        await conn.run_sync(Blob.__table__.create)
+
+    with tempfile.TemporaryDirectory() as images_dir:
+        config.IMAGES_DIR = images_dir
+        os.makedirs(os.path.join(images_dir, StorageService.BLOBS_DIR_NAME))
+
+        config.IMAGE_MAX_SIZE = max(sizes)
+        # Первая загрузка настраивает модели и пул потоков, в измерения не входит
+        await _upload(session_maker, _Body("warmup.jpg", 1))
+        for size in sizes:
+            body = _Body(f"upload-{size}.jpg", size)
+            status, elapsed, peak = await _measure(_upload(session_maker, body))
+            print(f"upload {size / MB:9.3f} MB: status {status or 200}, {elapsed * 1000:9.1f} ms, "
+                  f"{size / MB / elapsed:8.1f} MB/s, peak memory {peak / MB:6.2f} MB")
+
+        config.IMAGE_MAX_SIZE = limit
+        size = max(sizes)
+        print(f"file {size / MB:.0f} MB with IMAGE_MAX_SIZE {limit / MB:.0f} MB:")
+        for name, content_length in (("with Content-Length", True), ("chunked", False)):
+            body = _Body(f"too-big-{content_length}.jpg", size)
+            status, elapsed, _ = await _measure(_upload(session_maker, body, content_length))
+            print(f"  stream {name:<20} status {status}, read {body.received / MB:8.2f} MB of body, "
+                  f"{elapsed * 1000:8.1f} ms")
+        body = _Body("form.jpg", size)
+        _, elapsed, _ = await _measure(_form(body))
+        print(f"  request.form()              read {body.received / MB:8.2f} MB of body, {elapsed * 1000:8.1f} ms "
+              f"before the handler could check the size")
+
+    await engine.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Бенчмарк потоковой загрузки изображений")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1024, 200 * MB], help="размеры файлов в байтах")
+    parser.add_argument("--limit", type=int, default=10 * MB, help="IMAGE_MAX_SIZE для проверки отказа 413")
+    args = parser.parse_args()
+    asyncio.run(main(args.sizes, args.limit))